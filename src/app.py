@@ -1,10 +1,23 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
+from typing import Literal
+from .config import Config
+from .database.registry import UnknownDatabase
+from .llm.admission import PRIORITIES, AdmissionRejected
 from .text_to_sql import Text2SQL
+from .utils.cancellation import CancellationToken, RequestCancelled
+from .utils.logging_config import request_id, setup_logging
+from .utils.metrics import metrics
+from .utils.profiler import ProfilerBusy, sample_stacks
+import asyncio
 import logging
+import secrets
+import uuid
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # 创建FastAPI实例
@@ -14,13 +27,120 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# 初始化Text2SQL服务
-text2sql = Text2SQL()
+
+class RequestIdMiddleware:
+    """为每个请求设置请求ID（沿用 X-Request-ID 请求头，没有时生成），并在响应头中返回"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        current = headers.get(b"x-request-id", b"").decode("latin-1")[:64]
+        current = current or uuid.uuid4().hex[:16]
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", current.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = request_id.set(current)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
+
+
+app.add_middleware(RequestIdMiddleware)
+
+# Text2SQL服务，生产模式下由 main 在 fork worker 之前预先创建
+text2sql: Text2SQL | None = None
+
+
+def get_text2sql() -> Text2SQL:
+    """获取Text2SQL服务实例，未创建时在当前进程中初始化"""
+    global text2sql
+    if text2sql is None:
+        text2sql = Text2SQL()
+    return text2sql
+
+
+@app.on_event("startup")
+async def startup():
+    """启动时加载模型，避免首个请求承担初始化开销"""
+    registry = get_text2sql().registry
+    registry.start_eviction()
+    registry.start_schema_refresh()
+    registry.start_compaction()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """关闭时写入尚未保存的示例"""
+    if text2sql is not None:
+        text2sql.write_behind.stop()
+
+
+def rejection_error(e: AdmissionRejected) -> HTTPException:
+    """把准入拒绝转换为带 Retry-After 的HTTP错误"""
+    logger.warning(f"请求未被准入: {str(e)}")
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def cancellation_error(e: RequestCancelled) -> HTTPException:
+    """把请求取消转换为HTTP错误（超时为504，客户端断开为499）"""
+    logger.warning(f"请求已取消: {str(e)}")
+    return HTTPException(status_code=504 if e.timed_out else 499, detail=str(e))
+
+
+async def run_cancellable(request: Request, func, *args):
+    """在线程池中执行 func，客户端断开或超过截止时间时取消
+
+    func 需接受 cancel 关键字参数。取消后继续等待 func 退出，
+    使其占用的LLM调用和数据库连接在返回前释放。
+
+    Raises:
+        RequestCancelled: 请求被取消或超过截止时间
+    """
+    cancel = CancellationToken(Config.REQUEST_TIMEOUT)
+    task = asyncio.ensure_future(run_in_threadpool(func, *args, cancel=cancel))
+    aborted = False
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=Config.DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if aborted:
+            continue
+        if cancel.expired:
+            metrics.increment("requests.timed_out")
+            reason, timed_out = "请求超过截止时间", True
+        elif await request.is_disconnected():
+            metrics.increment("requests.disconnected")
+            reason, timed_out = "客户端已断开连接", False
+        else:
+            continue
+        # 取消回调会中止阻塞中的LLM调用和数据库查询，在线程池中执行
+        aborted = True
+        await run_in_threadpool(cancel.cancel, reason, timed_out)
 
 
 # 定义请求和响应模型
 class SQLRequest(BaseModel):
     query: str
+    database: str | None = None
+    tables: list[str] | None = None
+    # 批量任务使用 batch，LLM调用排队时排在交互请求之后
+    priority: Literal["interactive", "batch"] = "interactive"
 
 
 class SQLResponse(BaseModel):
@@ -29,6 +149,13 @@ class SQLResponse(BaseModel):
     error: str | None = None
     columns: list = []
     similar_examples: list = []
+    prompt_tokens: int | None = None
+    # 提示中命中LLM上下文缓存的token数
+    cache_hit_tokens: int | None = None
+    # executed: 已在数据库上执行验证；syntax_only: 数据库不可用，仅验证了语法
+    validation: str | None = None
+    # template: 由相似示例的模板生成；llm: 由LLM生成
+    generation: str | None = None
 
 
 @app.get("/")
@@ -41,25 +168,87 @@ async def root():
     }
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """返回当前进程的运行指标"""
+    return metrics.snapshot()
+
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, description="采样秒数"),
+    interval: float = Query(0.01, gt=0, le=1, description="采样间隔秒数"),
+    x_admin_token: str | None = Header(None),
+):
+    """对当前 worker 进程做定时栈采样，返回折叠栈文本（可生成火焰图）"""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(
+        x_admin_token, Config.ADMIN_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="无效的管理令牌")
+
+    seconds = min(seconds, Config.PROFILE_MAX_SECONDS)
+    logger.info(f"开始性能采样: {seconds} 秒，间隔 {interval} 秒")
+    try:
+        return await run_in_threadpool(sample_stacks, seconds, interval)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 @app.get("/generate-sql", response_model=SQLResponse)
-async def generate_sql_get(query: str = Query(..., description="自然语言查询")):
+async def generate_sql_get(
+    request: Request,
+    query: str = Query(..., description="自然语言查询"),
+    database: str | None = Query(None, description="目标数据库，默认使用配置中的DB_NAME"),
+    tables: str | None = Query(None, description="问题涉及的表，逗号分隔，用于过滤相似示例"),
+    priority: Literal["interactive", "batch"] = Query(
+        "interactive", description="请求优先级，批量任务使用 batch"
+    ),
+):
     """通过GET请求生成SQL查询"""
     try:
-        logger.info(f"收到GET请求: {query}")
-        result = text2sql.generate_sql(query)
+        # 在线程池中执行，使并发请求互不阻塞事件循环（相同问题会被合并）
+        table_list = [t.strip() for t in tables.split(",") if t.strip()] if tables else None
+        result = await run_cancellable(
+            request,
+            get_text2sql().generate_sql,
+            query,
+            database,
+            table_list,
+            PRIORITIES[priority],
+        )
         return result
+    except AdmissionRejected as e:
+        raise rejection_error(e)
+    except RequestCancelled as e:
+        raise cancellation_error(e)
+    except UnknownDatabase as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"处理请求时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
 
 
 @app.post("/generate-sql", response_model=SQLResponse)
-async def generate_sql_post(request: SQLRequest):
+async def generate_sql_post(request: SQLRequest, raw_request: Request):
     """通过POST请求生成SQL查询"""
     try:
-        logger.info(f"收到POST请求: {request.query}")
-        result = text2sql.generate_sql(request.query)
+        result = await run_cancellable(
+            raw_request,
+            get_text2sql().generate_sql,
+            request.query,
+            request.database,
+            request.tables,
+            PRIORITIES[request.priority],
+        )
         return result
+    except AdmissionRejected as e:
+        raise rejection_error(e)
+    except RequestCancelled as e:
+        raise cancellation_error(e)
+    except UnknownDatabase as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"处理请求时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
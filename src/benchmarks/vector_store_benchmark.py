@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""InMemoryVectorStore 微基准测试
+
+使用合成的嵌入向量测量向量存储在不同规模、维度和 top_k 下的表现：
+- 插入速率 (add_vector)
+- 搜索延迟 (search)
+- 持久化耗时 (save / load)
+- 进程常驻内存
+- 可选：各压缩方式的编码体积、搜索延迟和相对精确搜索的召回率
+
+结果以 JSON 输出，便于在不同版本之间比较。
+
+用法:
+    python -m src.benchmarks.vector_store_benchmark --sizes 1000 10000 --dims 384 768
+    python -m src.benchmarks.vector_store_benchmark --sizes 100000 --dims 384 \
+        --compression float16 int8 pca
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from ..rag.vectordb.compression import codes_nbytes
+from ..rag.vectordb.vector_store import InMemoryVectorStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_DIMS = [384, 768]
+DEFAULT_TOP_K = [1, 5, 20]
+
+
+def get_rss_mb():
+    """获取当前进程的常驻内存 (MB)
+
+    优先读取 /proc/self/status，不可用时退回到 resource 模块的峰值内存。
+
+    Returns:
+        float: 常驻内存大小 (MB)
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    import resource
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 上单位为字节，Linux 上为 KB
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def generate_embeddings(count, dim, seed=42):
+    """生成单位长度的合成嵌入向量
+
+    Args:
+        count: 向量数量
+        dim: 向量维度
+        seed: 随机种子
+
+    Returns:
+        numpy数组，形状为 (count, dim)，dtype 为 float32
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def generate_structured_embeddings(count, dim, rank=64, noise=0.05, seed=42):
+    """生成近似低秩的合成嵌入向量
+
+    真实的句向量集中在少数方向上，各向同性的随机向量会低估 pca 等依赖
+    数据结构的压缩方式，因此压缩测试使用低秩加噪声的向量。
+
+    Args:
+        count: 向量数量
+        dim: 向量维度
+        rank: 主要方向的数量
+        noise: 噪声强度
+        seed: 随机种子
+
+    Returns:
+        numpy数组，形状为 (count, dim)，dtype 为 float32
+    """
+    rng = np.random.default_rng(seed)
+    basis = np.random.default_rng(0).standard_normal((rank, dim), dtype=np.float32)
+    weights = rng.standard_normal((count, rank), dtype=np.float32)
+    vectors = weights @ basis + noise * rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run_case(size, dim, top_k_values, num_queries, work_dir):
+    """运行单个 (规模, 维度) 组合的基准测试
+
+    Args:
+        size: 向量数量
+        dim: 向量维度
+        top_k_values: 要测量的 top_k 列表
+        num_queries: 每个 top_k 的查询次数
+        work_dir: 持久化文件所在目录
+
+    Returns:
+        dict: 该组合的测量结果
+    """
+    gc.collect()
+    vectors = generate_embeddings(size, dim)
+    queries = generate_embeddings(num_queries, dim, seed=7)
+
+    save_path = os.path.join(work_dir, f"vector_store_{size}_{dim}.pkl")
+    store = InMemoryVectorStore(save_path=save_path)
+
+    rss_before = get_rss_mb()
+
+    # 插入
+    start = time.perf_counter()
+    for i in range(size):
+        # 复制一份，模拟模型每次返回独立数组的真实情况
+        store.add_vector(
+            vectors[i].copy(), {"question": f"问题 {i}", "sql": f"SELECT {i};"}
+        )
+    insert_seconds = time.perf_counter() - start
+    rss_after_insert = get_rss_mb()
+
+    # 搜索
+    search_results = {}
+    for top_k in top_k_values:
+        # 预热一次，避免首次调用的分配开销影响统计
+        store.search(queries[0], top_k=top_k)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.search(query, top_k=top_k)
+            latencies.append(time.perf_counter() - start)
+        search_results[str(top_k)] = {
+            "mean_ms": float(np.mean(latencies) * 1000),
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p95_ms": _percentile_ms(latencies, 95),
+            "max_ms": float(np.max(latencies) * 1000),
+            "qps": float(len(latencies) / np.sum(latencies)),
+        }
+
+    rss_after_search = get_rss_mb()
+
+    # 持久化
+    start = time.perf_counter()
+    store.save()
+    save_seconds = time.perf_counter() - start
+    file_mb = os.path.getsize(save_path) / (1024 * 1024)
+
+    del store
+    gc.collect()
+
+    loaded = InMemoryVectorStore(save_path=save_path)
+    start = time.perf_counter()
+    loaded.load()
+    load_seconds = time.perf_counter() - start
+    loaded_count = len(loaded)
+
+    del loaded, vectors, queries
+    gc.collect()
+    os.remove(save_path)
+
+    return {
+        "size": size,
+        "dim": dim,
+        "insert_seconds": insert_seconds,
+        "insert_per_second": size / insert_seconds if insert_seconds else None,
+        "search": search_results,
+        "save_seconds": save_seconds,
+        "load_seconds": load_seconds,
+        "file_mb": file_mb,
+        "loaded_count": loaded_count,
+        "rss_before_mb": rss_before,
+        "rss_after_insert_mb": rss_after_insert,
+        "rss_after_search_mb": rss_after_search,
+        "rss_store_delta_mb": rss_after_insert - rss_before,
+    }
+
+
+def _search_ids(store, queries, top_k):
+    """依次执行查询，返回各次耗时和返回的示例ID集合"""
+    store.search(queries[0], top_k=top_k)
+    latencies, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = store.search(query, top_k=top_k)
+        latencies.append(time.perf_counter() - start)
+        ids.append({m["id"] for _, m in found})
+    return latencies, ids
+
+
+def _recall(ids, exact_ids, top_k):
+    """与精确搜索结果相同的比例"""
+    return float(np.mean([len(a & b) / top_k for a, b in zip(ids, exact_ids)]))
+
+
+def run_compression_case(size, dim, compressions, top_k, num_queries):
+    """比较各压缩方式的体积、搜索延迟和召回率
+
+    召回率为压缩搜索（近似打分 + 精确重排）返回的 top_k 中，与未压缩的
+    精确搜索结果相同的比例。除一次性构建外，还测量逐条追加构建的存储
+    （需要拟合的编码在追加过程中重新拟合）的召回率。
+
+    Args:
+        size: 向量数量
+        dim: 向量维度
+        compressions: 压缩方式列表
+        top_k: 返回的结果数
+        num_queries: 查询次数
+
+    Returns:
+        dict: 各压缩方式的测量结果
+    """
+    gc.collect()
+    vectors = generate_structured_embeddings(size, dim)
+    queries = generate_structured_embeddings(num_queries, dim, seed=7)
+    metadata = [{"question": f"问题 {i}", "sql": f"SELECT {i};", "id": i} for i in range(size)]
+
+    exact_ids = None
+    results = {}
+    for compression in ["none"] + [c for c in compressions if c != "none"]:
+        store = InMemoryVectorStore(
+            save_path=os.devnull, max_size=0, dedup_threshold=0, compression=compression
+        )
+        start = time.perf_counter()
+        store._replace(vectors, [dict(m) for m in metadata])
+        build_seconds = time.perf_counter() - start
+
+        latencies, ids = _search_ids(store, queries, top_k)
+        if exact_ids is None:
+            exact_ids = ids
+
+        codes = store._snapshot.codes
+        vectors_mb = store.vectors.nbytes / (1024 * 1024)
+        codes_mb = codes_nbytes(codes[1], size) / (1024 * 1024) if codes else None
+        results[compression] = {
+            "build_seconds": build_seconds,
+            "vectors_mb": vectors_mb,
+            "codes_mb": codes_mb,
+            # 原始向量仍保留在内存中用于重排，压缩不会减少总内存
+            "resident_mb": vectors_mb + (codes_mb or 0),
+            "p50_ms": _percentile_ms(latencies, 50),
+            "p95_ms": _percentile_ms(latencies, 95),
+            f"recall@{top_k}": _recall(ids, exact_ids, top_k),
+        }
+        del store
+
+        if compression != "none":
+            store = InMemoryVectorStore(
+                save_path=os.devnull, max_size=0, dedup_threshold=0, compression=compression
+            )
+            start = time.perf_counter()
+            store.add_vectors(vectors, [dict(m) for m in metadata])
+            results[compression]["incremental_build_seconds"] = time.perf_counter() - start
+            ids = _search_ids(store, queries, top_k)[1]
+            results[compression][f"incremental_recall@{top_k}"] = _recall(
+                ids, exact_ids, top_k
+            )
+            del store
+        gc.collect()
+
+    return {"size": size, "dim": dim, "top_k": top_k, "compression": results}
+
+
+def _git_revision():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def run_benchmarks(
+    sizes, dims, top_k_values, num_queries, work_dir=None, compressions=None
+):
+    """运行全部基准测试组合
+
+    Args:
+        sizes: 向量数量列表
+        dims: 向量维度列表
+        top_k_values: top_k 列表
+        num_queries: 每个 top_k 的查询次数
+        work_dir: 持久化文件目录，默认使用临时目录
+        compressions: 需要比较的压缩方式列表，为空时不测试压缩
+
+    Returns:
+        dict: 包含运行环境信息和各组合结果的字典
+    """
+    report = {
+        "benchmark": "vector_store",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "num_queries": num_queries,
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        for dim in dims:
+            for size in sizes:
+                logger.info(f"基准测试: size={size}, dim={dim}")
+                result = run_case(size, dim, top_k_values, num_queries, tmp_dir)
+                logger.info(
+                    f"插入 {result['insert_per_second']:.0f} 条/秒, "
+                    f"保存 {result['save_seconds']:.3f}s, "
+                    f"加载 {result['load_seconds']:.3f}s, "
+                    f"内存增量 {result['rss_store_delta_mb']:.1f}MB"
+                )
+                report["results"].append(result)
+
+    if compressions:
+        report["compression"] = []
+        for dim in dims:
+            for size in sizes:
+                logger.info(f"压缩测试: size={size}, dim={dim}")
+                report["compression"].append(
+                    run_compression_case(size, dim, compressions, max(top_k_values), num_queries)
+                )
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="InMemoryVectorStore 微基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--dims", type=int, nargs="+", default=DEFAULT_DIMS)
+    parser.add_argument("--top-k", type=int, nargs="+", default=DEFAULT_TOP_K)
+    parser.add_argument("--queries", type=int, default=20, help="每个 top_k 的查询次数")
+    parser.add_argument("--work-dir", default=None, help="持久化文件的临时目录")
+    parser.add_argument(
+        "--compression",
+        nargs="*",
+        choices=["none", "float16", "int8", "pca"],
+        default=None,
+        help="比较这些压缩方式的体积、延迟和召回率",
+    )
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    report = run_benchmarks(
+        args.sizes, args.dims, args.top_k, args.queries, args.work_dir, args.compression
+    )
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        logger.info(f"基准测试结果已写入 {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
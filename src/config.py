@@ -10,6 +10,23 @@ class Config:
     SSH_KEY_PATH = os.getenv("SSH_KEY_PATH")
     DB_HOST = os.getenv("DB_HOST")
     DB_NAME = os.getenv("DB_NAME")
+    # 允许请求访问的数据库列表（逗号分隔），默认只有 DB_NAME
+    DB_NAMES = [
+        name.strip()
+        for name in os.getenv("DB_NAMES", os.getenv("DB_NAME") or "").split(",")
+        if name.strip()
+    ]
+    # 每个数据库连接池的最大连接数
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+    # 连接池已满时等待空闲连接的最长秒数（请求的剩余时间更短时以其为准）
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # 数据库空闲多少秒后释放其连接池、Schema缓存和示例存储，0表示不释放
+    DB_IDLE_TIMEOUT = int(os.getenv("DB_IDLE_TIMEOUT", "1800"))
+    # 数据库连续连接失败多少次后熔断（降级为仅语法验证），以及熔断期间的探测间隔秒数
+    DB_BREAKER_FAILURES = int(os.getenv("DB_BREAKER_FAILURES", "3"))
+    DB_BREAKER_PROBE_INTERVAL = float(os.getenv("DB_BREAKER_PROBE_INTERVAL", "10"))
+    # 后台增量刷新Schema的间隔秒数，0表示不自动刷新
+    SCHEMA_REFRESH_INTERVAL = int(os.getenv("SCHEMA_REFRESH_INTERVAL", "300"))
     DB_USER = os.getenv("DB_USER")
     DEEPSEEK = os.getenv("DEEPSEEK")
     DB_PASSWORD = os.getenv("DB_PASSWORD")
@@ -18,3 +35,85 @@ class Config:
     BERT_MODEL_NAME = os.getenv(
         "BERT_MODEL_NAME", "paraphrase-multilingual-MiniLM-L12-v2"
     )
+    # torch 算子内/算子间的线程数，0表示自动（多 worker 时按CPU核数平均分配，否则使用torch默认值）
+    TORCH_INTRA_OP_THREADS = int(os.getenv("TORCH_INTRA_OP_THREADS", "0"))
+    TORCH_INTER_OP_THREADS = int(os.getenv("TORCH_INTER_OP_THREADS", "0"))
+    # Schema提示文本格式: compact（每表一行）或 verbose（逐列列出）
+    SCHEMA_FORMAT = os.getenv("SCHEMA_FORMAT", "compact")
+    # 用于统计提示token数的分词器，留空时按字符数估算
+    TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "deepseek-ai/DeepSeek-V3")
+    # 发送给LLM的提示token预算（包括系统提示），0表示不限制
+    PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+    # 提示中最多使用的相似示例数（按相似度取前几个，没有相似示例时使用内置示例）
+    PROMPT_EXAMPLES = int(os.getenv("PROMPT_EXAMPLES", "3"))
+    # LLM调用准入控制: 每秒放行的调用数（0表示不限制）、突发容量、
+    # 排队请求数上限和最长排队秒数。速率和突发容量是整个服务的限额，
+    # 多进程模式下按 SERVER_WORKERS 平分给各 worker；排队上限按 worker 计
+    LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "5"))
+    LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+    LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "100"))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+    # 并行生成的候选SQL数量（1表示只调用一次LLM），以及等待有效候选的最长秒数
+    LLM_CANDIDATES = int(os.getenv("LLM_CANDIDATES", "1"))
+    LLM_CANDIDATE_BUDGET = float(os.getenv("LLM_CANDIDATE_BUDGET", "30"))
+    # 是否尝试由相似示例的模板直接生成SQL（只替换问题中的取值），失败时再调用LLM
+    TEMPLATE_SYNTHESIS = os.getenv("TEMPLATE_SYNTHESIS", "true").lower() == "true"
+    # 示例向量存储的最大条数，超出时按淘汰策略移除，0表示不限制
+    VECTOR_STORE_MAX_SIZE = int(os.getenv("VECTOR_STORE_MAX_SIZE", "10000"))
+    # 新示例与已有示例的余弦相似度不低于该值时视为重复，只更新已有示例
+    VECTOR_STORE_DEDUP_THRESHOLD = float(
+        os.getenv("VECTOR_STORE_DEDUP_THRESHOLD", "0.97")
+    )
+    # 超出最大条数时一次淘汰到 最大条数×该比例，避免每新增一条都重建索引
+    VECTOR_STORE_EVICT_WATERMARK = float(
+        os.getenv("VECTOR_STORE_EVICT_WATERMARK", "0.9")
+    )
+    # 淘汰策略: lru（最久未使用）或 lfu（使用次数最少）
+    VECTOR_STORE_EVICTION = os.getenv("VECTOR_STORE_EVICTION", "lru")
+    # 后台压缩（合并重复示例并执行容量限制）的间隔秒数，0表示不压缩
+    VECTOR_STORE_COMPACT_INTERVAL = int(
+        os.getenv("VECTOR_STORE_COMPACT_INTERVAL", "600")
+    )
+    # 多进程模式下写入进程发布快照的最短间隔秒数（期间的新示例合并发布），
+    # 同时也是 worker 后台检查新快照的间隔
+    VECTOR_STORE_PUBLISH_INTERVAL = float(
+        os.getenv("VECTOR_STORE_PUBLISH_INTERVAL", "1")
+    )
+    # 检索时词法（BM25）得分与向量相似度融合的权重，0表示只用向量相似度
+    VECTOR_STORE_LEXICAL_WEIGHT = float(os.getenv("VECTOR_STORE_LEXICAL_WEIGHT", "0.3"))
+    # 存储条数不少于该值时先用BM25选出候选示例，只对候选计算向量相似度，0表示不预筛选
+    VECTOR_STORE_PREFILTER_MIN_SIZE = int(
+        os.getenv("VECTOR_STORE_PREFILTER_MIN_SIZE", "50000")
+    )
+    # BM25预筛选保留的候选数
+    VECTOR_STORE_PREFILTER_CANDIDATES = int(
+        os.getenv("VECTOR_STORE_PREFILTER_CANDIDATES", "2000")
+    )
+    # 搜索使用的向量压缩方式: none、float16、int8（按向量缩放）或 pca（降维）
+    # 压缩用于减少搜索时读取的数据量，不节省内存：重排仍需原始 float32 向量，
+    # 单进程时编码额外占用内存，多进程时写入进程每次发布还会多写一份编码
+    VECTOR_STORE_COMPRESSION = os.getenv("VECTOR_STORE_COMPRESSION", "none")
+    # pca 压缩的目标维度
+    VECTOR_STORE_PCA_DIM = int(os.getenv("VECTOR_STORE_PCA_DIM", "128"))
+    # 压缩编码近似打分后，用原始向量精确重排的候选数
+    VECTOR_STORE_RERANK_CANDIDATES = int(
+        os.getenv("VECTOR_STORE_RERANK_CANDIDATES", "100")
+    )
+    # 新示例后台批量写入: 每批条数、最长写入间隔秒数和队列容量
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "64"))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "2"))
+    WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+    # 单个请求的截止秒数（超过后中止LLM调用和数据库查询），0表示不限制
+    REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
+    # 处理请求期间检查客户端是否已断开连接的间隔秒数
+    DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+    # 管理接口（/admin/*）的访问令牌，通过 X-Admin-Token 请求头传入，留空时禁用管理接口
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    # 单次性能采样的最长秒数
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+    # 日志级别
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # 请求日志中记录完整SQL和提示的请求比例（0到1）
+    LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+    # 生产模式下的 worker 进程数，大于1时共享预加载的模型和向量存储
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
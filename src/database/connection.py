@@ -4,7 +4,8 @@ from sshtunnel import SSHTunnelForwarder
 from ..config import Config
 
 class MySQLSSHConnection:
-    def __init__(self):
+    def __init__(self, db_name=None):
+        self.db_name = db_name or Config.DB_NAME
         self.tunnel = None
         self.connection = None
         self.cursor = None
@@ -22,23 +23,35 @@ class MySQLSSHConnection:
             self.connection = pymysql.connect(
                 user=Config.DB_USER,
                 passwd=Config.DB_PASSWORD,
-                host='127.0.0.1',  # ʹñصַ
-                db=Config.DB_NAME,
+                host='127.0.0.1',  # 使用本地地址
+                db=self.db_name,
                 port=self.tunnel.local_bind_port,
             )
             self.cursor = self.connection.cursor()
             return self.cursor
         except Exception as e:
             self.close()
-            raise Exception(f"ݿʧ: {str(e)}")
+            raise Exception(f"数据库连接失败: {str(e)}")
+
+    def is_alive(self):
+        if not self.connection or not self.tunnel or not self.tunnel.is_active:
+            return False
+        try:
+            self.connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
 
     def close(self):
         if self.cursor:
             self.cursor.close()
+            self.cursor = None
         if self.connection:
             self.connection.close()
+            self.connection = None
         if self.tunnel:
             self.tunnel.close()
+            self.tunnel = None
 
     def __enter__(self):
         return self.connect()
@@ -17,8 +17,13 @@ class MySQLLocalConnection:
     - 自动重试和错误处理
     """
 
-    def __init__(self):
-        """初始化连接管理器"""
+    def __init__(self, db_name=None):
+        """初始化连接管理器
+
+        Args:
+            db_name: 数据库名称，默认为None，使用配置中的DB_NAME
+        """
+        self.db_name = db_name or Config.DB_NAME
         self.connection = None
         self.cursor = None
 
@@ -32,14 +37,14 @@ class MySQLLocalConnection:
             Exception: 连接失败时抛出异常
         """
         try:
-            logger.info(f"连接到数据库: {Config.DB_NAME}")
+            logger.info(f"连接到数据库: {self.db_name}")
 
             self.connection = pymysql.connect(
                 host=Config.DB_HOST or "localhost",  # 默认使用localhost
                 port=int(Config.DB_PORT) or 3306,  # 默认使用3306端口
                 user=Config.DB_USER,
                 passwd=Config.DB_PASSWORD,
-                db=Config.DB_NAME,
+                db=self.db_name,
                 charset="utf8mb4",  # 使用utf8mb4字符集
                 cursorclass=pymysql.cursors.DictCursor,  # 使用字典游标
             )
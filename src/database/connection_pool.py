@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from .connection import MySQLSSHConnection
+from ..config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(TimeoutError):
+    """等待空闲连接超时（连接池已满，不代表数据库不可用）"""
+
+
+class ConnectionPool:
+    """数据库连接池
+
+    为单个数据库维护一组已建立的 SSH 隧道和 MySQL 连接，避免每次查询
+    都重新建立隧道。连接按需创建，数量不超过 max_size，取出时会检测
+    连接是否仍然可用。
+    """
+
+    def __init__(self, db_name=None, max_size=4, connection_factory=None, timeout=None):
+        """初始化连接池
+
+        Args:
+            db_name: 数据库名称，默认为None，使用配置中的DB_NAME
+            max_size: 最大连接数
+            connection_factory: 创建连接对象的函数，参数为数据库名称，
+                默认为 MySQLSSHConnection
+            timeout: 默认的等待空闲连接秒数，默认为配置中的DB_POOL_TIMEOUT
+        """
+        self.db_name = db_name
+        self.max_size = max_size
+        self.timeout = Config.DB_POOL_TIMEOUT if timeout is None else timeout
+        self.connection_factory = connection_factory or MySQLSSHConnection
+        self._idle = []
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_size)
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """从连接池取出一个可用连接
+
+        Args:
+            timeout: 等待空闲连接的秒数，默认为连接池的 timeout
+
+        Returns:
+            已连接的连接对象
+
+        Raises:
+            PoolTimeout: 等待超时
+            Exception: 建立新连接失败时抛出异常
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self._semaphore.acquire(timeout=timeout):
+            raise PoolTimeout(f"等待数据库 {self.db_name} 的连接超时")
+
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    break
+                if connection.is_alive():
+                    return connection
+                logger.info(f"丢弃已失效的数据库连接: {self.db_name}")
+                connection.close()
+
+            connection = self.connection_factory(self.db_name)
+            connection.connect()
+            logger.info(f"为数据库 {self.db_name} 建立新连接")
+            return connection
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def release(self, connection, discard=False):
+        """将连接归还连接池
+
+        Args:
+            connection: 由 acquire 取出的连接
+            discard: 是否直接关闭该连接而不放回连接池
+        """
+        try:
+            if discard or self._closed:
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+        finally:
+            self._semaphore.release()
+
+    def close(self):
+        """关闭连接池中所有空闲连接，借出的连接在归还时关闭"""
+        self._closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+        logger.info(f"数据库 {self.db_name} 的连接池已关闭")
+
+
+class PooledConnection:
+    """基于连接池的连接对象
+
+    与 MySQLSSHConnection 接口一致（connect 返回游标，close 释放），
+    可以直接替换 SchemaManager 和 SQLValidator 中的连接。每个线程
+    独立借出连接，因此同一实例可被多个请求线程同时使用。
+    """
+
+    def __init__(self, pool):
+        """初始化连接对象
+
+        Args:
+            pool: 连接池
+        """
+        self.pool = pool
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """当前线程借出的底层连接，没有借出时为None"""
+        return getattr(self._local, "connection", None)
+
+    def connect(self, timeout=None):
+        """从连接池借出连接并返回新游标
+
+        Args:
+            timeout: 等待空闲连接的秒数，默认为连接池的 timeout
+
+        Returns:
+            数据库游标对象
+
+        Raises:
+            PoolTimeout: 等待超时
+        """
+        connection = self.pool.acquire(timeout)
+        try:
+            cursor = connection.connection.cursor()
+        except Exception:
+            self.pool.release(connection, discard=True)
+            raise
+        self._local.connection = connection
+        self._local.cursor = cursor
+        return cursor
+
+    def close(self):
+        """关闭游标并将连接归还连接池"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return
+
+        cursor = self._local.cursor
+        self._local.connection = None
+        self._local.cursor = None
+
+        discard = False
+        try:
+            cursor.close()
+        except Exception:
+            discard = True
+        self.pool.release(connection, discard=discard)
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
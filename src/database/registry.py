@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import threading
+import time
+from .connection_pool import ConnectionPool, PooledConnection
+from .schema_manager import SchemaManager
+from .sql_validator import SQLValidator
+from ..config import Config
+from ..rag.vectordb.vector_store import InMemoryVectorStore, get_store_path
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownDatabase(ValueError):
+    """请求的数据库不在允许列表中"""
+
+
+def default_vector_store_factory(db_name):
+    """为数据库创建并加载进程内的示例向量存储
+
+    Args:
+        db_name: 数据库名称
+
+    Returns:
+        InMemoryVectorStore: 已加载的向量存储
+    """
+    store = InMemoryVectorStore(save_path=get_store_path(db_name))
+    store.load()
+    return store
+
+
+class DatabaseContext:
+    """单个数据库的服务组件
+
+    包含该数据库的连接池、Schema管理器（及其提示文本缓存）、
+    SQL验证器和示例向量存储分区。
+    """
+
+    def __init__(self, db_name, pool_size, vector_store_factory):
+        """初始化数据库上下文
+
+        Args:
+            db_name: 数据库名称
+            pool_size: 连接池最大连接数
+            vector_store_factory: 创建示例向量存储的函数，参数为数据库名称
+        """
+        self.db_name = db_name
+        self.pool = ConnectionPool(db_name, max_size=pool_size)
+        self.schema_manager = SchemaManager(db_name, PooledConnection(self.pool))
+        self.sql_validator = SQLValidator(db_name, PooledConnection(self.pool))
+        self.vector_store = vector_store_factory(db_name)
+        self.last_used = time.monotonic()
+
+    def touch(self):
+        """记录最近一次使用时间"""
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """释放该数据库占用的连接"""
+        self.pool.close()
+
+
+class DatabaseRegistry:
+    """多数据库注册表
+
+    在同一进程中为多个数据库按需创建 DatabaseContext，共享同一个
+    BERT模型和LLM客户端；长时间未访问的数据库会被释放。
+    """
+
+    def __init__(
+        self,
+        db_names=None,
+        vector_store_factory=None,
+        pool_size=None,
+        idle_timeout=None,
+    ):
+        """初始化数据库注册表
+
+        Args:
+            db_names: 允许访问的数据库列表，默认为配置中的DB_NAMES
+            vector_store_factory: 创建示例向量存储的函数，参数为数据库名称
+            pool_size: 每个数据库连接池的最大连接数，默认为配置中的DB_POOL_SIZE
+            idle_timeout: 空闲释放的秒数，默认为配置中的DB_IDLE_TIMEOUT
+        """
+        self.db_names = list(db_names or Config.DB_NAMES)
+        self.default_db = Config.DB_NAME or (self.db_names[0] if self.db_names else None)
+        self.vector_store_factory = vector_store_factory or default_vector_store_factory
+        self.pool_size = pool_size or Config.DB_POOL_SIZE
+        self.idle_timeout = Config.DB_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self._contexts = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}  # 数据库名称 -> 创建该数据库上下文时持有的锁
+        self._eviction_pid = None
+        self._refresh_pid = None
+        self._compact_pid = None
+
+    def get(self, db_name=None):
+        """获取数据库上下文，不存在时创建
+
+        Args:
+            db_name: 数据库名称，默认为None，使用默认数据库
+
+        Returns:
+            DatabaseContext: 数据库上下文
+
+        Raises:
+            UnknownDatabase: 数据库不在允许列表中
+        """
+        db_name = db_name or self.default_db
+        if self.db_names and db_name not in self.db_names:
+            raise UnknownDatabase(f"未知的数据库: {db_name}")
+
+        with self._lock:
+            context = self._contexts.get(db_name)
+            if context is not None:
+                context.touch()
+                return context
+            load_lock = self._load_locks.setdefault(db_name, threading.Lock())
+
+        # 创建上下文需要连接数据库和加载示例，只持有该数据库的锁，
+        # 不阻塞其他数据库的请求
+        with load_lock:
+            with self._lock:
+                context = self._contexts.get(db_name)
+            if context is None:
+                logger.info(f"加载数据库: {db_name}")
+                context = DatabaseContext(
+                    db_name, self.pool_size, self.vector_store_factory
+                )
+                with self._lock:
+                    self._contexts[db_name] = context
+            context.touch()
+            return context
+
+    def loaded(self):
+        """返回当前已加载的数据库上下文列表"""
+        with self._lock:
+            return list(self._contexts.values())
+
+    def evict_idle(self):
+        """释放空闲时间超过阈值的数据库
+
+        Returns:
+            list: 被释放的数据库名称
+        """
+        if not self.idle_timeout:
+            return []
+
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                name
+                for name, context in self._contexts.items()
+                if now - context.last_used > self.idle_timeout
+            ]
+            evicted = [self._contexts.pop(name) for name in idle]
+
+        for context in evicted:
+            context.close()
+            logger.info(f"数据库 {context.db_name} 空闲超时，已释放")
+
+        return idle
+
+    def start_eviction(self, interval=60):
+        """启动后台线程定期释放空闲数据库
+
+        线程不会跨 fork 继承，因此每个进程需要各自调用一次。
+
+        Args:
+            interval: 检查间隔秒数
+        """
+        if not self.idle_timeout or self._eviction_pid == os.getpid():
+            return
+        self._eviction_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    logger.error(f"释放空闲数据库失败: {str(e)}")
+
+        threading.Thread(target=run, name="db-eviction", daemon=True).start()
+
+    def refresh_schemas(self):
+        """对所有已加载的数据库执行一次增量Schema刷新"""
+        for context in self.loaded():
+            try:
+                context.schema_manager.refresh_schema()
+            except Exception as e:
+                logger.error(f"刷新数据库 {context.db_name} 的Schema失败: {str(e)}")
+
+    def start_schema_refresh(self, interval=None):
+        """启动后台线程定期增量刷新已加载数据库的Schema
+
+        Args:
+            interval: 刷新间隔秒数，默认为配置中的SCHEMA_REFRESH_INTERVAL
+        """
+        interval = Config.SCHEMA_REFRESH_INTERVAL if interval is None else interval
+        if not interval or self._refresh_pid == os.getpid():
+            return
+        self._refresh_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.refresh_schemas()
+
+        threading.Thread(target=run, name="schema-refresh", daemon=True).start()
+
+    def compact_vector_stores(self):
+        """压缩所有已加载数据库的示例存储，有变化时保存"""
+        for context in self.loaded():
+            try:
+                if context.vector_store.compact():
+                    context.vector_store.save()
+            except Exception as e:
+                logger.error(f"压缩数据库 {context.db_name} 的示例存储失败: {str(e)}")
+
+    def start_compaction(self, interval=None):
+        """启动后台线程定期压缩已加载数据库的示例存储
+
+        Args:
+            interval: 压缩间隔秒数，默认为配置中的VECTOR_STORE_COMPACT_INTERVAL
+        """
+        interval = Config.VECTOR_STORE_COMPACT_INTERVAL if interval is None else interval
+        if not interval or self._compact_pid == os.getpid():
+            return
+        self._compact_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.compact_vector_stores()
+
+        threading.Thread(target=run, name="vector-store-compaction", daemon=True).start()
+
+    def close(self):
+        """释放所有数据库"""
+        with self._lock:
+            contexts, self._contexts = list(self._contexts.values()), {}
+        for context in contexts:
+            context.close()
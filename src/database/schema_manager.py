@@ -1,22 +1,57 @@
 # -*- coding: utf-8 -*-
 from .connection import MySQLSSHConnection
+from ..config import Config
+import hashlib
 import json
 import os
 import logging
+import threading
+from collections import namedtuple
 
 logger = logging.getLogger(__name__)
 
+# 发布给读者的不可变Schema快照，整体替换，读者不会看到新旧状态混合
+SchemaSnapshot = namedtuple(
+    "SchemaSnapshot", ["schema_info", "table_prompts", "prompt", "version"]
+)
+
 
 class SchemaManager:
     """数据库Schema管理器
 
-    负责提取和格式化数据库结构信息。
+    负责提取和格式化数据库结构信息，并支持只重新提取发生变化的表的增量刷新。
     """
 
-    def __init__(self):
-        """初始化Schema管理器"""
-        self.connection = MySQLSSHConnection()
-        self.schema_cache_path = "data/schema_cache.json"
+    def __init__(self, db_name=None, connection=None, schema_format=None):
+        """初始化Schema管理器
+
+        Args:
+            db_name: 数据库名称，默认为None，使用配置中的DB_NAME
+            connection: 数据库连接对象，默认为该数据库的MySQLSSHConnection
+            schema_format: 提示文本格式，"compact" 或 "verbose"，默认为配置中的SCHEMA_FORMAT
+        """
+        self.db_name = db_name or Config.DB_NAME
+        self.schema_format = schema_format or Config.SCHEMA_FORMAT
+        self.connection = connection or MySQLSSHConnection(self.db_name)
+        if self.db_name == Config.DB_NAME:
+            self.schema_cache_path = "data/schema_cache.json"
+        else:
+            self.schema_cache_path = f"data/schema_cache_{self.db_name}.json"
+        self._snapshot = None
+        self._listeners = []
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def schema_info(self):
+        """当前的Schema信息，尚未加载时为None"""
+        snapshot = self._snapshot
+        return snapshot.schema_info if snapshot is not None else None
+
+    @property
+    def schema_version(self):
+        """当前Schema提示文本的版本，尚未加载时为None"""
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else None
 
     def extract_schema(self, force_refresh=False):
         """提取数据库Schema信息
@@ -56,16 +91,22 @@ class SchemaManager:
 
             logger.info(f"发现 {len(tables)} 个表")
 
+            fingerprints = self._fetch_table_fingerprints(cursor)
+
             # 获取每个表的详细信息
             for table in tables:
                 logger.info(f"正在处理表: {table}")
                 table_info = self._extract_table_info(cursor, table)
+                table_info["fingerprint"] = fingerprints.get(table)
                 schema_info[table] = table_info
 
             # 缓存结果
             self._save_schema_cache(schema_info)
             logger.info("Schema信息提取完成")
 
+            if force_refresh and self.schema_info is not None:
+                self._set_schema(schema_info)
+
             return schema_info
 
         except Exception as e:
@@ -74,6 +115,194 @@ class SchemaManager:
         finally:
             self.connection.close()
 
+    def refresh_schema(self):
+        """增量刷新Schema
+
+        对比 INFORMATION_SCHEMA 中每个表的创建时间和列校验和与缓存中的记录，
+        只重新提取新增或结构发生变化的表，删除已不存在的表，并只重新渲染
+        这些表的提示文本。
+
+        Returns:
+            dict: 包含 added、changed、removed 三个表名列表的刷新结果
+        """
+        with self._refresh_lock:
+            if self.schema_info is None:
+                self._set_schema(self.extract_schema())
+
+            schema_info = dict(self.schema_info)
+            result = {"added": [], "changed": [], "removed": []}
+
+            try:
+                cursor = self.connection.connect()
+                fingerprints = self._fetch_table_fingerprints(cursor)
+
+                for table, fingerprint in fingerprints.items():
+                    cached = schema_info.get(table)
+                    if cached is None:
+                        result["added"].append(table)
+                    elif not self._same_fingerprint(cached.get("fingerprint"), fingerprint):
+                        result["changed"].append(table)
+                    else:
+                        continue
+
+                    logger.info(f"重新提取表结构: {table}")
+                    table_info = self._extract_table_info(cursor, table)
+                    table_info["fingerprint"] = fingerprint
+                    schema_info[table] = table_info
+
+                for table in list(schema_info):
+                    if table not in fingerprints:
+                        result["removed"].append(table)
+                        del schema_info[table]
+
+            except Exception as e:
+                logger.error(f"增量刷新数据库结构失败: {str(e)}")
+                raise
+            finally:
+                self.connection.close()
+
+            updated = result["added"] + result["changed"]
+            if updated or result["removed"]:
+                self._save_schema_cache(schema_info)
+                self._set_schema(schema_info, updated, result["removed"])
+                logger.info(
+                    f"数据库 {self.db_name} 的Schema已增量刷新: "
+                    f"新增 {len(result['added'])}，变更 {len(result['changed'])}，"
+                    f"删除 {len(result['removed'])}"
+                )
+
+                for listener in self._listeners:
+                    try:
+                        listener(
+                            {table: schema_info[table] for table in updated},
+                            result["removed"],
+                        )
+                    except Exception as e:
+                        logger.error(f"Schema变更回调执行失败: {str(e)}")
+
+            return result
+
+    def add_listener(self, callback):
+        """注册Schema变更回调
+
+        增量刷新发现变化时调用，用于更新由Schema派生的数据（例如表结构的嵌入向量）。
+
+        Args:
+            callback: 回调函数，参数为 (变更表名到表信息的字典, 被删除的表名列表)
+        """
+        self._listeners.append(callback)
+
+    def _fetch_table_fingerprints(self, cursor):
+        """从 INFORMATION_SCHEMA 获取每个表的结构指纹
+
+        指纹包括表的创建时间、更新时间，以及由列定义和外键计算出的校验和。
+
+        Args:
+            cursor: 数据库游标
+
+        Returns:
+            dict: 表名到指纹字典的映射
+        """
+        cursor.execute(
+            """
+            SELECT TABLE_NAME, CREATE_TIME, UPDATE_TIME
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = DATABASE()
+        """
+        )
+        tables = [
+            self._row_values(row, ["TABLE_NAME", "CREATE_TIME", "UPDATE_TIME"])
+            for row in cursor.fetchall()
+        ]
+
+        cursor.execute(
+            """
+            SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE,
+                   COLUMN_DEFAULT, COLUMN_KEY
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """
+        )
+        column_rows = cursor.fetchall()
+
+        cursor.execute(
+            """
+            SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+            WHERE CONSTRAINT_SCHEMA = DATABASE()
+                AND REFERENCED_TABLE_NAME IS NOT NULL
+            ORDER BY TABLE_NAME, COLUMN_NAME
+        """
+        )
+        fk_rows = cursor.fetchall()
+
+        checksums = {}
+        for row in column_rows:
+            values = self._row_values(
+                row,
+                [
+                    "TABLE_NAME",
+                    "COLUMN_NAME",
+                    "COLUMN_TYPE",
+                    "IS_NULLABLE",
+                    "COLUMN_DEFAULT",
+                    "COLUMN_KEY",
+                ],
+            )
+            checksums.setdefault(values[0], hashlib.md5()).update(
+                repr(values[1:]).encode("utf-8")
+            )
+        for row in fk_rows:
+            values = self._row_values(
+                row,
+                [
+                    "TABLE_NAME",
+                    "COLUMN_NAME",
+                    "REFERENCED_TABLE_NAME",
+                    "REFERENCED_COLUMN_NAME",
+                ],
+            )
+            checksums.setdefault(values[0], hashlib.md5()).update(
+                repr(("FK",) + tuple(values[1:])).encode("utf-8")
+            )
+
+        fingerprints = {}
+        for table, create_time, update_time in tables:
+            checksum = checksums.get(table)
+            fingerprints[table] = {
+                "create_time": str(create_time) if create_time else None,
+                "update_time": str(update_time) if update_time else None,
+                "checksum": checksum.hexdigest() if checksum else None,
+            }
+        return fingerprints
+
+    def _same_fingerprint(self, cached, current):
+        """判断表结构是否未发生变化
+
+        UPDATE_TIME 会随数据写入而变化，只记录不参与比较；结构变化由
+        创建时间（ALTER TABLE 重建表时改变）和列校验和判断。
+
+        Args:
+            cached: 缓存中的指纹
+            current: 当前的指纹
+
+        Returns:
+            bool: 结构是否相同
+        """
+        if not cached:
+            return False
+        return (
+            cached.get("create_time") == current["create_time"]
+            and cached.get("checksum") == current["checksum"]
+        )
+
+    def _row_values(self, row, keys):
+        """按列顺序取出查询结果行的值，兼容字典游标和元组游标"""
+        if isinstance(row, dict):
+            return [row[key] for key in keys]
+        return list(row)
+
     def _extract_table_info(self, cursor, table):
         """提取单个表的详细信息
 
@@ -188,12 +417,127 @@ class SchemaManager:
         """
         try:
             os.makedirs(os.path.dirname(self.schema_cache_path), exist_ok=True)
-            with open(self.schema_cache_path, "w", encoding="utf-8") as f:
+            # 先写临时文件再替换，避免多个进程同时刷新时读到不完整的缓存
+            tmp_path = f"{self.schema_cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
                 json.dump(schema_info, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.schema_cache_path)
             logger.info(f"Schema信息已缓存到: {self.schema_cache_path}")
         except Exception as e:
             logger.error(f"缓存Schema信息失败: {str(e)}")
 
+    def get_schema_prompt(self):
+        """获取用于提示的Schema文本
+
+        首次调用时提取并格式化Schema，之后直接返回内存中的结果。
+
+        Returns:
+            str: 格式化后的Schema字符串
+        """
+        return self.get_schema_snapshot().prompt
+
+    def get_schema_snapshot(self):
+        """获取当前的Schema快照，提示文本与版本来自同一次更新
+
+        Returns:
+            SchemaSnapshot: 包含 schema_info、table_prompts、prompt 和 version
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._refresh_lock:
+                if self._snapshot is None:
+                    self._set_schema(self.extract_schema())
+                snapshot = self._snapshot
+        return snapshot
+
+    def _set_schema(self, schema_info, updated=None, removed=None):
+        """更新内存中的Schema及其提示文本
+
+        Args:
+            schema_info (dict): 新的Schema信息
+            updated (list, optional): 需要重新渲染的表，为None时渲染全部表
+            removed (list, optional): 已删除的表
+        """
+        if updated is None:
+            table_prompts = {
+                table_name: self._render_table(table_name, table_info)
+                for table_name, table_info in schema_info.items()
+            }
+        else:
+            table_prompts = dict(self._snapshot.table_prompts)
+            for table_name in removed or []:
+                table_prompts.pop(table_name, None)
+            for table_name in updated:
+                table_prompts[table_name] = self._render_table(
+                    table_name, schema_info[table_name]
+                )
+
+        tables = [table_prompts[name] for name in schema_info]
+        if self.schema_format == "compact":
+            schema_prompt = "\n".join(tables)
+        else:
+            schema_prompt = "\n".join(["数据库架构信息:"] + tables)
+
+        self._snapshot = SchemaSnapshot(
+            schema_info,
+            table_prompts,
+            schema_prompt,
+            hashlib.md5(schema_prompt.encode("utf-8")).hexdigest()[:12],
+        )
+
+    def _render_table(self, table_name, table_info):
+        """按配置的格式渲染单个表"""
+        if self.schema_format == "compact":
+            return self._format_table_compact(table_name, table_info)
+        return self._format_table(table_name, table_info)
+
+    def format_schema_compact(self, schema_info=None):
+        """将Schema信息格式化为紧凑的提示文本
+
+        每个表占一行，形如 ``table(col type pk, col type -> ref.col, ...)``，
+        比逐列的格式节省大量token。
+
+        Args:
+            schema_info (dict, optional): Schema信息。如果为None，则重新提取
+
+        Returns:
+            str: 格式化后的Schema字符串
+        """
+        if schema_info is None:
+            schema_info = self.extract_schema()
+
+        return "\n".join(
+            self._format_table_compact(table_name, table_info)
+            for table_name, table_info in schema_info.items()
+        )
+
+    def _format_table_compact(self, table_name, table_info):
+        """将单个表的信息格式化为紧凑的一行文本
+
+        Args:
+            table_name (str): 表名
+            table_info (dict): 表信息
+
+        Returns:
+            str: 格式化后的表结构字符串
+        """
+        primary_keys = set(table_info["primary_keys"])
+        foreign_keys = {
+            fk["column"]: f"{fk['referenced_table']}.{fk['referenced_column']}"
+            for fk in table_info["foreign_keys"]
+        }
+
+        columns = []
+        for column in table_info["columns"]:
+            text = f"{column['name']} {column['type']}"
+            if column["name"] in primary_keys:
+                text += " pk"
+            if column["name"] in foreign_keys:
+                text += f" -> {foreign_keys[column['name']]}"
+            columns.append(text)
+
+        return f"{table_name}({', '.join(columns)})"
+
     def format_schema_for_prompt(self, schema_info=None):
         """将Schema信息格式化为适合提示的文本形式
 
@@ -209,30 +553,44 @@ class SchemaManager:
         formatted_text = ["数据库架构信息:"]
 
         for table_name, table_info in schema_info.items():
-            # 添加表名
-            formatted_text.append(f"\n表名: {table_name}")
-
-            # 添加列信息
-            formatted_text.append("列:")
-            for column in table_info["columns"]:
-                nullable = "NULL" if column["nullable"] else "NOT NULL"
-                default = f"DEFAULT {column['default']}" if column["default"] else ""
+            formatted_text.append(self._format_table(table_name, table_info))
+
+        return "\n".join(formatted_text)
+
+    def _format_table(self, table_name, table_info):
+        """将单个表的信息格式化为提示文本
+
+        Args:
+            table_name (str): 表名
+            table_info (dict): 表信息
+
+        Returns:
+            str: 格式化后的表结构字符串
+        """
+        # 添加表名
+        formatted_text = [f"\n表名: {table_name}"]
+
+        # 添加列信息
+        formatted_text.append("列:")
+        for column in table_info["columns"]:
+            nullable = "NULL" if column["nullable"] else "NOT NULL"
+            default = f"DEFAULT {column['default']}" if column["default"] else ""
+            formatted_text.append(
+                f"  - {column['name']} {column['type']} {nullable} {default}".strip()
+            )
+
+        # 添加主键信息
+        if table_info["primary_keys"]:
+            formatted_text.append("主键:")
+            for pk in table_info["primary_keys"]:
+                formatted_text.append(f"  - {pk}")
+
+        # 添加外键信息
+        if table_info["foreign_keys"]:
+            formatted_text.append("外键:")
+            for fk in table_info["foreign_keys"]:
                 formatted_text.append(
-                    f"  - {column['name']} {column['type']} {nullable} {default}".strip()
+                    f"  - {fk['column']} -> {fk['referenced_table']}.{fk['referenced_column']}"
                 )
 
-            # 添加主键信息
-            if table_info["primary_keys"]:
-                formatted_text.append("主键:")
-                for pk in table_info["primary_keys"]:
-                    formatted_text.append(f"  - {pk}")
-
-            # 添加外键信息
-            if table_info["foreign_keys"]:
-                formatted_text.append("外键:")
-                for fk in table_info["foreign_keys"]:
-                    formatted_text.append(
-                        f"  - {fk['column']} -> {fk['referenced_table']}.{fk['referenced_column']}"
-                    )
-
         return "\n".join(formatted_text)
@@ -3,12 +3,25 @@ import logging
 import os
 import re
 import shutil
+import threading
+import pymysql
 import sqlparse
 from .connection import MySQLSSHConnection
+from .connection_pool import PooledConnection, PoolTimeout
+from ..config import Config
+from ..utils.cancellation import RequestCancelled
+from ..utils.circuit_breaker import CircuitBreaker
 from typing import Tuple, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# 表示与MySQL的连接已断开或无法建立的错误码
+CONNECTION_ERROR_CODES = {2003, 2006, 2013, 2055}
+
+# 验证方式：在数据库上执行，或仅检查语法（数据库不可用时的降级）
+EXECUTED = "executed"
+SYNTAX_ONLY = "syntax_only"
+
 
 class SQLValidator:
     """SQL验证器
@@ -20,11 +33,24 @@ class SQLValidator:
     - 查询执行测试
     - 磁盘空间检查
     - 结果集大小限制
+    - 数据库不可用时熔断，降级为仅语法验证
     """
 
-    def __init__(self):
-        """初始化SQL验证器"""
-        self.connection = MySQLSSHConnection()
+    def __init__(self, db_name=None, connection=None):
+        """初始化SQL验证器
+
+        Args:
+            db_name: 数据库名称，默认为None，使用配置中的DB_NAME
+            connection: 数据库连接对象，默认为该数据库的MySQLSSHConnection
+        """
+        self.db_name = db_name
+        self.connection = connection or MySQLSSHConnection(db_name)
+        self.breaker = CircuitBreaker(
+            f"db.{db_name or Config.DB_NAME}",
+            self.ping,
+            failure_threshold=Config.DB_BREAKER_FAILURES,
+            probe_interval=Config.DB_BREAKER_PROBE_INTERVAL,
+        )
 
     def validate_syntax(self, sql_query: str) -> Tuple[bool, str]:
         """验证SQL语法是否正确
@@ -53,6 +79,39 @@ class SQLValidator:
             logger.error(f"SQL语法验证失败: {str(e)}")
             return False, f"SQL验证错误: {str(e)}"
 
+    def validate(
+        self, sql_query: str, cancel=None
+    ) -> Tuple[bool, str, List[str], str]:
+        """验证SQL，数据库不可用或磁盘空间不足时降级为仅语法验证
+
+        Args:
+            sql_query: 要验证的SQL查询语句
+            cancel: 请求的取消标记（可选），取消时终止正在执行的查询
+
+        Returns:
+            Tuple[bool, str, List[str], str]:
+                - bool: 表示是否有效
+                - str: 错误信息或成功消息
+                - List[str]: 查询结果的列名列表（仅语法验证时为空）
+                - str: 验证方式，EXECUTED 或 SYNTAX_ONLY
+
+        Raises:
+            RequestCancelled: 请求被取消或超过截止时间
+        """
+        valid, message, columns, unavailable = self._execute(sql_query, cancel)
+        if unavailable:
+            reason = "数据库不可用"
+        elif not valid and self._is_disk_full_error(message):
+            reason = "服务器磁盘空间不足"
+        else:
+            return valid, message, columns, EXECUTED
+
+        logger.warning(f"{reason}，仅进行语法验证")
+        valid, syntax_error = self.validate_syntax(sql_query)
+        if valid:
+            return True, f"SQL语法正确，但{reason}，无法执行", [], SYNTAX_ONLY
+        return False, syntax_error, [], SYNTAX_ONLY
+
     def test_execute(self, sql_query: str) -> Tuple[bool, str, List[str]]:
         """测试执行SQL查询
 
@@ -65,14 +124,84 @@ class SQLValidator:
                 - str: 错误信息或成功消息
                 - List[str]: 查询结果的列名列表
         """
-        try:
-            # 首先验证语法
-            valid, error_msg = self.validate_syntax(sql_query)
-            if not valid:
-                return False, error_msg, []
+        return self._execute(sql_query)[:3]
+
+    def ping(self) -> bool:
+        """检查数据库是否可用（供熔断器后台探测）
 
-            # 获取数据库连接和游标
+        Returns:
+            bool: 能否执行 SELECT 1
+        """
+        try:
             cursor = self.connection.connect()
+            cursor.execute("SELECT 1")
+            return True
+        finally:
+            self.connection.close()
+
+    def _execute(
+        self, sql_query: str, cancel=None
+    ) -> Tuple[bool, str, List[str], bool]:
+        """在数据库上执行SQL，并把连接失败记录到熔断器
+
+        给出取消标记时，请求被取消后通过另一个连接对当前连接执行
+        KILL QUERY，正在执行的查询随即中止。
+
+        Returns:
+            Tuple[bool, str, List[str], bool]: test_execute 的结果，以及数据库
+                是否不可用（熔断器打开或连接失败）
+
+        Raises:
+            RequestCancelled: 请求被取消或超过截止时间
+        """
+        # 首先验证语法
+        valid, error_msg = self.validate_syntax(sql_query)
+        if not valid:
+            return False, error_msg, [], False
+
+        if not self.breaker.allow():
+            return False, "数据库不可用（熔断中）", [], True
+
+        if cancel is not None:
+            cancel.check()
+
+        connected = False
+        remove_callback = None
+        killer = None
+        # 取消回调可能在 finally 注销之后才被执行，两者通过该锁和 finished
+        # 保证：要么 finally 等待已发出的 KILL QUERY 完成，要么回调不再执行
+        kill_lock = threading.Lock()
+        finished = False
+        try:
+            # 获取数据库连接和游标，等待连接池的时间不超过请求的剩余时间
+            if isinstance(self.connection, PooledConnection):
+                remaining = cancel.remaining() if cancel is not None else None
+                cursor = self.connection.connect(
+                    timeout=None
+                    if remaining is None
+                    else min(remaining, self.connection.pool.timeout)
+                )
+            else:
+                cursor = self.connection.connect()
+            connected = True
+
+            if cancel is not None:
+                thread_id = cursor.connection.thread_id()
+
+                def kill():
+                    nonlocal killer
+                    with kill_lock:
+                        if finished:
+                            return
+                        killer = threading.Thread(
+                            target=self._kill_query,
+                            args=(thread_id,),
+                            name="sql-kill",
+                            daemon=True,
+                        )
+                        killer.start()
+
+                remove_callback = cancel.add_callback(kill)
 
             # 检查磁盘空间
             self._check_disk_space()
@@ -82,20 +211,67 @@ class SQLValidator:
 
             # 限制结果集大小
             limited_query = self._limit_query_results(sql_query)
-            logger.info(f"执行限制后的SQL: {limited_query}")
+            logger.debug(f"执行限制后的SQL: {limited_query}")
 
             # 执行查询
             cursor.execute(limited_query)
 
             # 获取并处理结果集信息
-            return self._process_query_results(cursor)
+            result = self._process_query_results(cursor)
+            self.breaker.record_success()
+            return (*result, False)
 
         except Exception as e:
-            return self._handle_execution_error(e)
+            if cancel is not None and cancel.cancelled:
+                raise RequestCancelled(
+                    f"查询已中止: {str(e)}", cancel.expired
+                ) from e
+            if isinstance(e, PoolTimeout):
+                # 连接池已满不代表数据库不可用，不计入熔断器
+                logger.warning(str(e))
+                return False, f"数据库繁忙: {str(e)}", [], True
+            unavailable = not connected or self._is_connection_error(e)
+            if unavailable:
+                self.breaker.record_failure(e)
+            else:
+                # SQL本身的错误说明数据库可以访问
+                self.breaker.record_success()
+            return (*self._handle_execution_error(e), unavailable)
 
         finally:
+            if remove_callback is not None:
+                remove_callback()
+            with kill_lock:
+                finished = True
+            # 等待 KILL QUERY 完成后再归还连接，避免中止复用该连接的其他查询
+            if killer is not None:
+                killer.join(timeout=10)
             self.connection.close()
 
+    def _kill_query(self, thread_id: int) -> None:
+        """通过新建的连接终止指定连接上正在执行的查询
+
+        Args:
+            thread_id: 要终止的查询所在连接的线程ID
+        """
+        connection = MySQLSSHConnection(self.db_name)
+        try:
+            cursor = connection.connect()
+            cursor.execute(f"KILL QUERY {int(thread_id)}")
+            logger.info(f"已终止数据库连接 {thread_id} 上的查询")
+        except Exception as e:
+            logger.warning(f"终止数据库查询失败: {str(e)}")
+        finally:
+            connection.close()
+
+    def _is_connection_error(self, error: Exception) -> bool:
+        """判断执行过程中的错误是否为连接断开"""
+        return (
+            isinstance(error, pymysql.err.OperationalError)
+            and bool(error.args)
+            and error.args[0] in CONNECTION_ERROR_CODES
+        )
+
     def _is_safe_query(self, sql_query: str) -> bool:
         """检查是否是安全的查询（只读操作）
 
@@ -154,7 +330,7 @@ class SQLValidator:
         if ends_with_semicolon:
             limited_sql += ";"
 
-        logger.info(f"添加限制后的SQL: {limited_sql}")
+        logger.debug(f"添加限制后的SQL: {limited_sql}")
         return limited_sql
 
     def _process_query_results(self, cursor) -> Tuple[bool, str, List[str]]:
@@ -173,12 +349,18 @@ class SQLValidator:
                 # 对于DictCursor
                 column_names = [desc.name for desc in cursor.description]
 
-            logger.info(f"SQL验证成功, 列名: {column_names}")
+            logger.debug(f"SQL验证成功, 列名: {column_names}")
             return True, "查询有效", column_names
         else:
-            logger.info("SQL验证成功，但无结果集")
+            logger.debug("SQL验证成功，但无结果集")
             return True, "查询有效 (无结果集)", []
 
+    @staticmethod
+    def _is_disk_full_error(message: str) -> bool:
+        """错误信息是否表示数据库服务器磁盘空间不足"""
+        message = message.lower()
+        return any(error in message for error in ("space left on device", "disk full"))
+
     def _handle_execution_error(self, error: Exception) -> Tuple[bool, str, List[str]]:
         """处理执行过程中的错误
 
@@ -191,9 +373,9 @@ class SQLValidator:
         error_str = str(error)
         logger.error(f"SQL执行错误: {error_str}")
 
-        # 特殊处理磁盘空间不足错误
-        if "No space left on device" in error_str:
-            logger.warning("服务器磁盘空间不足，但SQL语法检查通过")
-            return True, "SQL语法正确，但服务器磁盘空间不足", []
+        # 磁盘空间不足时SQL并未执行，返回失败，由 validate 降级为仅语法验证
+        if self._is_disk_full_error(error_str):
+            logger.warning("服务器磁盘空间不足，SQL未能执行")
+            return False, f"服务器磁盘空间不足: {error_str}", []
 
         return False, f"SQL执行错误: {error_str}", []
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from ..config import Config
+from ..utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 请求优先级，数值越小越先被放行
+INTERACTIVE = 0
+BATCH = 1
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入
+
+    Attributes:
+        status_code: 建议返回的HTTP状态码（429 排队已满，503 排队超时）
+        retry_after: 建议客户端重试前等待的秒数
+    """
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """排队中的一个请求"""
+
+    def __init__(self, priority, deadline):
+        self.priority = priority
+        self.deadline = deadline
+
+
+class AdmissionController:
+    """LLM 调用准入控制
+
+    令牌桶限制调用速率（允许 burst 次突发）；令牌不足时请求进入有界的
+    优先级队列，交互请求排在批量任务之前，同一优先级先到先得。队列已满
+    时立即拒绝（429），排队超过 queue_timeout 秒时放弃（503），两者都
+    给出建议的重试时间，避免突发流量下所有请求一起等待超时。
+    """
+
+    def __init__(
+        self, rate=None, burst=None, max_queue=None, queue_timeout=None, name="llm"
+    ):
+        """初始化
+
+        Args:
+            rate: 每秒放行的调用数，默认为配置中的LLM_RATE_LIMIT 按 worker
+                数平分，0表示不限制
+            burst: 令牌桶容量，默认为配置中的LLM_BURST 按 worker 数平分
+            max_queue: 排队请求数上限，默认为配置中的LLM_QUEUE_SIZE
+            queue_timeout: 最长排队秒数，默认为配置中的LLM_QUEUE_TIMEOUT
+            name: 指标名前缀
+        """
+        # 令牌桶在每个 worker 进程中各有一个，配置的是整个服务的限额
+        workers = max(1, Config.SERVER_WORKERS)
+        self.rate = Config.LLM_RATE_LIMIT / workers if rate is None else rate
+        self.burst = max(1, burst or Config.LLM_BURST // workers)
+        self.max_queue = Config.LLM_QUEUE_SIZE if max_queue is None else max_queue
+        self.queue_timeout = (
+            Config.LLM_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        )
+        self.name = name
+        self._cond = threading.Condition()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._queue = []  # (优先级, 序号, _Waiter) 小顶堆
+        self._sequence = itertools.count()
+
+    def _refill(self, now):
+        """按经过的时间补充令牌（需持有锁）"""
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _retry_after(self, position):
+        """估算排在第 position 位的请求需要等待的秒数"""
+        return max(1, math.ceil(position / self.rate))
+
+    def acquire(self, priority=INTERACTIVE, cancel=None):
+        """等待准入，成功时返回，未准入时抛出 AdmissionRejected
+
+        Args:
+            priority: INTERACTIVE 或 BATCH
+            cancel: 请求的取消标记（可选），取消后立即退出排队
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+            RequestCancelled: 排队期间请求被取消
+        """
+        if cancel is not None:
+            cancel.check()
+        if not self.rate:
+            return
+
+        started = time.monotonic()
+        with self._cond:
+            self._refill(started)
+            if not self._queue and self._tokens >= 1:
+                self._tokens -= 1
+                metrics.increment(f"{self.name}.admission.admitted")
+                metrics.observe(f"{self.name}.admission.queue_seconds", 0.0)
+                return
+
+            if len(self._queue) >= self.max_queue:
+                metrics.increment(f"{self.name}.admission.rejected")
+                retry_after = self._retry_after(len(self._queue) + 1)
+                logger.warning(f"LLM调用排队已满（{len(self._queue)}），拒绝请求")
+                raise AdmissionRejected("请求过多，请稍后重试", 429, retry_after)
+
+            waiter = _Waiter(priority, started + self.queue_timeout)
+            entry = (priority, next(self._sequence), waiter)
+            heapq.heappush(self._queue, entry)
+            metrics.set_gauge(f"{self.name}.admission.queue_depth", len(self._queue))
+            remove_callback = (
+                cancel.add_callback(self._wake) if cancel is not None else None
+            )
+
+            try:
+                while True:
+                    if cancel is not None and cancel.cancelled:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        metrics.increment(f"{self.name}.admission.cancelled")
+                        cancel.check()
+                    now = time.monotonic()
+                    self._refill(now)
+                    head = self._queue[0][2] is waiter
+                    if head and self._tokens >= 1:
+                        heapq.heappop(self._queue)
+                        self._tokens -= 1
+                        metrics.increment(f"{self.name}.admission.admitted")
+                        metrics.observe(
+                            f"{self.name}.admission.queue_seconds", now - started
+                        )
+                        return
+
+                    remaining = waiter.deadline - now
+                    if remaining <= 0:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        metrics.increment(f"{self.name}.admission.timed_out")
+                        raise AdmissionRejected(
+                            "请求排队超时，请稍后重试",
+                            503,
+                            self._retry_after(len(self._queue) + 1),
+                        )
+
+                    # 队首等待下一个令牌，其余请求等待队首出队后被唤醒
+                    wait = remaining
+                    if cancel is not None and cancel.deadline is not None:
+                        wait = min(wait, cancel.remaining())
+                    if head:
+                        wait = min(wait, (1 - self._tokens) / self.rate)
+                    self._cond.wait(wait)
+            finally:
+                if remove_callback is not None:
+                    remove_callback()
+                metrics.set_gauge(
+                    f"{self.name}.admission.queue_depth", len(self._queue)
+                )
+                self._cond.notify_all()
+
+    def _wake(self):
+        """唤醒排队中的请求，使被取消的请求退出排队"""
+        with self._cond:
+            self._cond.notify_all()
@@ -1,10 +1,25 @@
 # -*- coding: utf-8 -*-
 import logging
+import re
+import threading
+from collections import OrderedDict
 from openai import OpenAI
 from ..config import Config
+from ..rag.vectordb.lexical_index import tokenize
+from ..utils.cancellation import RequestCancelled
+from ..utils.metrics import metrics
+from ..utils.request_log import current_request_log
+from .admission import INTERACTIVE, AdmissionController, AdmissionRejected
+from .token_counter import TokenCounter
 
 logger = logging.getLogger(__name__)
 
+# Schema块开头的表名（紧凑格式 "table(...)"，逐列格式 "表名: table"）
+_TABLE_NAME_PATTERN = re.compile(r"\s*(?:表名:\s*)?([A-Za-z_][\w$]*)")
+
+# 提示中示例部分的标题
+EXAMPLES_HEADER = "示例:\n"
+
 # 示例查询
 few_shot_example = [
     {
@@ -37,16 +52,37 @@ class Deepseek:
 4. 使用合适的WHERE条件"""
         self.few_shot_example = few_shot_example
         self.deepseek = Config.DEEPSEEK
+        self.token_counter = TokenCounter()
+        self.prompt_token_budget = Config.PROMPT_TOKEN_BUDGET
+        self.prompt_examples = Config.PROMPT_EXAMPLES
+        self.admission = AdmissionController()
+        # Schema文本 -> (前缀文本, 前缀token数)，多数据库时各有一个前缀
+        self._prefixes = OrderedDict()
+        self._prefix_cache_size = 32
+        self._prefix_lock = threading.Lock()
 
     def generate_full_prompt(
-        self, prompt: str, schema_info: str, few_shot_example=None
+        self,
+        prompt: str,
+        schema_info: str,
+        few_shot_example=None,
+        stats=None,
+        tables=None,
     ) -> str:
         """生成完整的提示信息
 
+        提示分为两部分：系统提示和Schema组成的前缀对同一Schema版本逐字节
+        不变，只计算一次，便于API的上下文缓存复用；示例和问题组成每次请求
+        不同的后缀。配置了token预算时，示例按顺序加入直到预算用完；前缀
+        加问题已超出预算时才按与问题的相关度裁剪表（此时前缀无法被缓存）。
+
         Args:
             prompt: 用户的查询提示
             schema_info: 数据库架构信息
-            few_shot_example: 示例查询列表（可选）
+            few_shot_example: 示例查询列表（可选），默认为内置示例
+            stats: 用于记录token统计的字典（可选），会写入 prompt_tokens、
+                prefix_tokens、dropped_examples 和 dropped_tables
+            tables: 相似示例引用的表（可选），裁剪Schema时优先保留
 
         Returns:
             str: 格式化后的完整提示文本
@@ -57,42 +93,236 @@ class Deepseek:
         if not prompt:
             raise ValueError("查询不能为空")
 
-        few_shot_example = few_shot_example or self.few_shot_example
+        few_shot_example = list(
+            self.few_shot_example if few_shot_example is None else few_shot_example
+        )
+        prefix, prefix_tokens = self._static_prefix(schema_info)
+        question = self._format_question(prompt)
+        prompt_tokens = prefix_tokens + self.token_counter.count(question)
+        budget = self.prompt_token_budget
+        dropped_tables = 0
+
+        if budget and prompt_tokens > budget:
+            prefix, dropped_tables = self._trim_schema(
+                prompt, schema_info, question, tables
+            )
+            prompt_tokens = self._count_prompt_tokens(prefix + question)
 
-        # 构建提示文本
-        full_prompt = f"数据库结构:\n{schema_info}\n\n"
+        # 示例按顺序（相关度从高到低）加入，第一个超出预算的示例及其后的示例不再加入
+        examples = ""
+        kept = 0
+        for example in few_shot_example:
+            text = self._format_example(example)
+            if not examples:
+                text = EXAMPLES_HEADER + text
+            tokens = self.token_counter.count(text)
+            if budget and prompt_tokens + tokens > budget:
+                break
+            examples += text
+            prompt_tokens += tokens
+            kept += 1
+        dropped_examples = len(few_shot_example) - kept
+        full_prompt = prefix + examples + question
 
-        if few_shot_example:
-            full_prompt += "示例:\n"
-            for example in few_shot_example:
-                full_prompt += f"问题:{example['question']}\nSQL:{example['sql']}\n\n"
+        if budget and prompt_tokens > budget:
+            logger.warning(f"提示token数 {prompt_tokens} 仍超出预算 {budget}")
 
-        full_prompt += f"请为以下问题生成 SQL:\n{prompt}"
+        if stats is not None:
+            stats["prompt_tokens"] = prompt_tokens
+            stats["prefix_tokens"] = prefix_tokens if not dropped_tables else 0
+            stats["dropped_examples"] = dropped_examples
+            stats["dropped_tables"] = dropped_tables
 
-        logger.debug(f"生成的完整提示: {full_prompt[:200]}...")  # 记录前200个字符
+        # 前缀对同一Schema不变，只记录每次请求不同的部分
+        log = current_request_log()
+        if log is not None:
+            log.payload(prompt_suffix=examples + question)
         return full_prompt
 
-    def get_response(self, prompt: str, schema_info: str) -> str:
+    def _static_prefix(self, schema_info):
+        """获取（并缓存）Schema对应的提示前缀及其与系统提示合计的token数
+
+        以Schema文本本身为键（字符串的哈希值只计算一次），Schema刷新后
+        文本不同即为新的键，不会把旧文本的前缀用于新版本。
+        """
+        with self._prefix_lock:
+            cached = self._prefixes.get(schema_info)
+            if cached is not None:
+                self._prefixes.move_to_end(schema_info)
+                return cached
+
+        prefix = self._format_schema(schema_info)
+        cached = (prefix, self._count_prompt_tokens(prefix))
+        with self._prefix_lock:
+            self._prefixes[schema_info] = cached
+            while len(self._prefixes) > self._prefix_cache_size:
+                self._prefixes.popitem(last=False)
+        return cached
+
+    def _trim_schema(self, prompt, schema_info, question, tables=None):
+        """按与问题的相关度裁剪表，使前缀加问题不超出token预算
+
+        Returns:
+            Tuple[str, int]: 裁剪后的前缀文本，以及裁剪掉的表数量
+        """
+        separator = "\n\n" if "\n\n" in schema_info else "\n"
+        schema_blocks = schema_info.split(separator)
+        prompt_tokens = self._count_prompt_tokens(
+            self._format_schema(schema_info) + question
+        )
+
+        # 保留标题行，不裁剪最后一个表
+        keep = set(range(len(schema_blocks)))
+        for index in self._rank_schema_blocks(prompt, schema_blocks, tables):
+            if prompt_tokens <= self.prompt_token_budget or len(keep) == 1:
+                break
+            keep.discard(index)
+            prompt_tokens -= self.token_counter.count(schema_blocks[index] + separator)
+
+        dropped_tables = len(schema_blocks) - len(keep)
+        logger.info(f"Schema超出token预算，已裁剪 {dropped_tables} 个表")
+        schema_blocks = [block for i, block in enumerate(schema_blocks) if i in keep]
+        return self._format_schema(separator.join(schema_blocks)), dropped_tables
+
+    def _format_schema(self, schema_info):
+        """格式化提示前缀中的Schema部分"""
+        return f"数据库结构:\n{schema_info}\n\n"
+
+    def _format_question(self, prompt):
+        """格式化提示末尾的问题部分"""
+        return f"请为以下问题生成 SQL:\n{prompt}"
+
+    def _select_examples(self, examples):
+        """从检索到的相似示例中选出提示使用的示例，去掉SQL重复的示例"""
+        selected, seen = [], set()
+        for example in examples or ():
+            if not isinstance(example, dict):
+                continue
+            if not example.get("question") or not example.get("sql"):
+                continue
+            if example["sql"] in seen:
+                continue
+            seen.add(example["sql"])
+            selected.append({"question": example["question"], "sql": example["sql"]})
+            if len(selected) >= self.prompt_examples:
+                break
+        return selected or self.few_shot_example
+
+    def _example_tables(self, examples):
+        """检索到的相似示例引用的全部表"""
+        tables = set()
+        for example in examples or ():
+            if isinstance(example, dict):
+                tables.update(example.get("tables") or ())
+        return tables
+
+    def _record_usage(self, usage, stats):
+        """记录API返回的token用量，包括上下文缓存命中和未命中的提示token数"""
+        hit = getattr(usage, "prompt_cache_hit_tokens", None)
+        miss = getattr(usage, "prompt_cache_miss_tokens", None)
+        if hit is not None:
+            metrics.increment("llm.prompt_cache_hit_tokens", hit)
+        if miss is not None:
+            metrics.increment("llm.prompt_cache_miss_tokens", miss)
+        if stats is not None:
+            stats["api_prompt_tokens"] = usage.prompt_tokens
+            stats["cache_hit_tokens"] = hit
+            stats["cache_miss_tokens"] = miss
+
+    def _format_example(self, example):
+        """格式化单个示例"""
+        return f"问题:{example['question']}\nSQL:{example['sql']}\n\n"
+
+    def _count_prompt_tokens(self, full_prompt):
+        """统计系统提示和用户提示的总token数"""
+        return self.token_counter.count(self.system_prompt) + self.token_counter.count(
+            full_prompt
+        )
+
+    def _rank_schema_blocks(self, prompt, schema_blocks, tables=None):
+        """按与问题的相关度从低到高排列可裁剪的Schema块
+
+        先比较块中的表是否被相似示例引用，再比较块与问题的匹配数：块中
+        出现在问题里的标识符（表名、列名，至少三个字符），加上块与问题共有
+        的中文词项（使用BM25索引的分词，按相邻两字匹配，如列注释）。相关度
+        相同时靠后的表先被裁剪，以冒号结尾的标题行不参与裁剪。
+
+        Args:
+            prompt: 用户的查询提示
+            schema_blocks: Schema文本块列表
+            tables: 相似示例引用的表（可选）
+
+        Returns:
+            list: 块索引列表，越靠前越先被裁剪
+        """
+        question = prompt.lower()
+        tables = {table.lower() for table in tables or ()}
+        terms = {
+            term for term in tokenize(prompt) if not term.isascii() and len(term) > 1
+        }
+        scored = []
+        for index, block in enumerate(schema_blocks):
+            if block.rstrip().endswith(":"):
+                continue
+            match = _TABLE_NAME_PATTERN.match(block)
+            referenced = bool(match and match.group(1).lower() in tables)
+            identifiers = set(re.findall(r"[A-Za-z_][A-Za-z0-9_]*", block.lower()))
+            score = sum(1 for name in identifiers if len(name) > 2 and name in question)
+            if terms:
+                score += len(terms.intersection(tokenize(block)))
+            scored.append((referenced, score, -index, index))
+        return [index for *_, index in sorted(scored)]
+
+    def get_response(
+        self,
+        prompt: str,
+        schema_info: str,
+        stats=None,
+        priority=INTERACTIVE,
+        cancel=None,
+        examples=None,
+    ) -> str:
         """获取 API 响应
 
+        调用前先经过准入控制，超出速率限制时排队等待。以流式方式接收响应，
+        请求被取消时关闭连接，不再等待剩余的生成内容。
+
         Args:
             prompt: 用户的查询提示
             schema_info: 数据库架构信息
+            stats: 用于记录token统计的字典（可选），除提示裁剪信息外，
+                还会写入API返回的 api_prompt_tokens、cache_hit_tokens 和
+                cache_miss_tokens
+            priority: 准入优先级，INTERACTIVE 或 BATCH
+            cancel: 请求的取消标记（可选），截止时间同时作为API调用的超时
+            examples: 检索到的相似示例（可选，按相似度降序），取前
+                PROMPT_EXAMPLES 个作为提示中的示例，没有时使用内置示例
 
         Returns:
             str: 生成的SQL语句
 
         Raises:
+            AdmissionRejected: 排队已满或排队超时
+            RequestCancelled: 请求被取消或超过截止时间
             Exception: API调用失败时抛出异常
         """
         try:
             full_prompt = self.generate_full_prompt(
-                prompt, schema_info, self.few_shot_example
+                prompt,
+                schema_info,
+                self._select_examples(examples),
+                stats,
+                tables=self._example_tables(examples),
             )
 
-            logger.info(f"发送到Deepseek的prompt前100个字符: {full_prompt[:100]}...")
+            self.admission.acquire(priority, cancel)
+
+            options = {}
+            if cancel is not None and cancel.deadline is not None:
+                cancel.check()
+                options["timeout"] = cancel.remaining()
 
-            response = self.client.chat.completions.create(
+            stream = self.client.chat.completions.create(
                 model=self.deepseek,
                 messages=[
                     {"role": "system", "content": self.system_prompt},
@@ -100,13 +330,38 @@ class Deepseek:
                 ],
                 max_tokens=1024,
                 temperature=0.7,
-                stream=False,
+                stream=True,
+                stream_options={"include_usage": True},
+                **options,
             )
+            remove_callback = (
+                cancel.add_callback(stream.close) if cancel is not None else None
+            )
+            try:
+                parts = []
+                for chunk in stream:
+                    if cancel is not None:
+                        cancel.check()
+                    if chunk.usage is not None:
+                        self._record_usage(chunk.usage, stats)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+            except Exception:
+                # 取消时关闭连接会使读取抛出异常
+                if cancel is not None:
+                    cancel.check()
+                raise
+            finally:
+                if remove_callback is not None:
+                    remove_callback()
+                stream.close()
 
-            sql = response.choices[0].message.content
-            logger.info(f"Deepseek返回的SQL: {sql}")
+            sql = "".join(parts)
+            logger.debug(f"Deepseek返回的SQL: {sql}")
             return sql
 
+        except (AdmissionRejected, RequestCancelled):
+            raise
         except Exception as e:
             logger.error(f"Deepseek API调用失败: {str(e)}")
             raise
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from ..config import Config
+
+logger = logging.getLogger(__name__)
+
+# 中日韩字符
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+class TokenCounter:
+    """提示token计数器
+
+    使用与LLM一致的分词器统计token数；分词器不可用时（未配置或无法下载），
+    按 DeepSeek 文档给出的经验值估算：中文字符约0.6个token，其他字符约0.3个token。
+    """
+
+    def __init__(self, tokenizer_name=None, cache_size=4096):
+        """初始化token计数器
+
+        Args:
+            tokenizer_name: HuggingFace 分词器名称，默认为配置中的TOKENIZER_NAME
+            cache_size: 计数结果缓存大小，Schema中的表文本会被反复统计
+        """
+        self.tokenizer_name = (
+            Config.TOKENIZER_NAME if tokenizer_name is None else tokenizer_name
+        )
+        self.tokenizer = None
+        # 以文本摘要为键，不让缓存持有完整的提示文本
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+
+        if self.tokenizer_name:
+            try:
+                from transformers import AutoTokenizer
+
+                self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                logger.info(f"已加载分词器: {self.tokenizer_name}")
+            except Exception as e:
+                logger.warning(f"加载分词器 {self.tokenizer_name} 失败，使用估算: {str(e)}")
+
+    def count(self, text: str) -> int:
+        """统计文本的token数（带缓存）
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            int: token数
+        """
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        result = self._count(text)
+        with self._cache_lock:
+            self._cache[key] = result
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _count(self, text: str) -> int:
+        """统计文本的token数
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            int: token数
+        """
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return self.estimate(text)
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """按字符类别估算token数
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            int: 估算的token数
+        """
+        cjk = len(CJK_PATTERN.findall(text))
+        return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
@@ -1,19 +1,132 @@
+import gc
+import os
+import signal
+import socket
+import time
 import uvicorn
 import logging
-from .app import app
+from .config import Config
+from .utils.logging_config import setup_logging, stop_logging
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
-def start_server(host="0.0.0.0", port=8000, reload=True):
-    """启动FastAPI服务器"""
+def start_server(host="0.0.0.0", port=8000, reload=True, workers=None):
+    """启动FastAPI服务器
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+        reload: 是否启用自动重载（仅单进程开发模式）
+        workers: worker 进程数，默认为 Config.SERVER_WORKERS，大于1时使用生产模式
+    """
+    workers = workers or Config.SERVER_WORKERS
+    if workers > 1:
+        start_production_server(host=host, port=port, workers=workers)
+        return
+
     logger.info(f"启动服务器，监听地址: {host}:{port}")
     uvicorn.run("src.app:app", host=host, port=port, reload=reload, log_level="info")
 
 
+def start_production_server(host="0.0.0.0", port=8000, workers=2):
+    """以预加载 + fork 的方式启动多 worker 生产服务器
+
+    主进程先启动唯一的向量存储写入进程，再加载 BERT 模型等组件，
+    最后 fork 出多个 worker 共享同一个监听 socket。模型权重在 fork 后
+    以写时复制的方式被所有 worker 共享，向量存储通过内存映射快照共享，
+    新示例统一交给写入进程持久化。
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+        workers: worker 进程数
+    """
+    from .rag.vectordb.shared_store import VectorStoreWriter
+    from . import app as app_module
+    from .text_to_sql import Text2SQL
+
+    # 写入进程不需要模型，在加载模型之前 fork 以保持其内存占用最小
+    writer = VectorStoreWriter()
+    writer.start()
+
+    logger.info("预加载模型和服务组件")
+    app_module.text2sql = Text2SQL(vector_store_factory=writer.create_reader)
+
+    # 冻结已有对象，避免 worker 中的垃圾回收改写对象头导致共享页被复制
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    logger.info(f"启动生产服务器，监听地址: {host}:{port}，worker 数: {workers}")
+
+    children = {}
+    shutting_down = False
+
+    def spawn_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            config = uvicorn.Config(app_module.app, log_level="info")
+            uvicorn.Server(config).run(sockets=[sock])
+            # os._exit 不会等待队列的后台发送线程，先确保关闭时写出的示例已送达写入进程
+            writer.queue.close()
+            writer.queue.join_thread()
+            stop_logging()
+            os._exit(0)
+        children[pid] = time.time()
+        logger.info(f"worker 进程已启动，PID: {pid}")
+
+    def handle_shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGTERM, handle_shutdown)
+
+    for _ in range(workers):
+        spawn_worker()
+
+    try:
+        while children:
+            time.sleep(0.5)
+            # worker 提交的示例都经由写入进程保存，它退出后需要立即重启
+            if not shutting_down:
+                writer.ensure_running()
+            for pid in list(children):
+                try:
+                    exited_pid, status = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    exited_pid, status = pid, -1
+                if exited_pid == 0:
+                    continue
+
+                started_at = children.pop(pid)
+                if not shutting_down:
+                    logger.warning(
+                        f"worker 进程 {pid} 意外退出，状态码: {status}，正在重启"
+                    )
+                    # 避免启动即崩溃时陷入快速重启循环
+                    if time.time() - started_at < 1:
+                        time.sleep(1)
+                    spawn_worker()
+    finally:
+        sock.close()
+        writer.stop()
+        logger.info("生产服务器已停止")
+
+
 if __name__ == "__main__":
     start_server()
@@ -1,14 +1,14 @@
+import os
 import random
+import threading
+from collections import OrderedDict
 import torch
 from sentence_transformers import SentenceTransformer
 from ...config import Config
+from ...utils.metrics import metrics
 from sklearn.metrics.pairwise import cosine_similarity
 import logging
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
 logger = logging.getLogger(__name__)
 
 
@@ -31,8 +31,10 @@ class BertEmbedding:
         self.device = (
             device if device else ("cuda" if torch.cuda.is_available() else "cpu")
         )
-        self.cache = {}
+        self.cache = OrderedDict()
         self.cache_size = cache_size
+        # 保护缓存的锁，只在读写缓存时持有，模型推理在锁外进行
+        self._cache_lock = threading.Lock()
 
         self.set_random_seed()
         self.load_model()
@@ -49,9 +51,34 @@ class BertEmbedding:
             torch.cuda.manual_seed_all(seed)
         logger.info(f"已设置随机种子: {seed}")
 
+    def configure_threads(self):
+        """按配置设置torch的算子内/算子间线程数并记录生效的值
+
+        多个 worker 在同一台机器上运行时，每个进程默认都使用全部CPU核，
+        线程数之和远超核数。未配置时按 worker 数平均分配CPU核。
+        """
+        intra_op = Config.TORCH_INTRA_OP_THREADS
+        if not intra_op and Config.SERVER_WORKERS > 1:
+            intra_op = max(1, (os.cpu_count() or 1) // Config.SERVER_WORKERS)
+        if intra_op:
+            torch.set_num_threads(intra_op)
+
+        if Config.TORCH_INTER_OP_THREADS:
+            try:
+                torch.set_num_interop_threads(Config.TORCH_INTER_OP_THREADS)
+            except RuntimeError as e:
+                # 算子间线程池启动后不能再修改
+                logger.warning(f"设置torch算子间线程数失败: {str(e)}")
+
+        intra_op, inter_op = torch.get_num_threads(), torch.get_num_interop_threads()
+        metrics.set_gauge("torch.intra_op_threads", intra_op)
+        metrics.set_gauge("torch.inter_op_threads", inter_op)
+        logger.info(f"torch线程数: 算子内 {intra_op}，算子间 {inter_op}")
+
     def load_model(self):
         """加载预训练的SentenceTransformer模型"""
         try:
+            self.configure_threads()
             self.model = SentenceTransformer(self.model_name, device=self.device)
             self.vector_size = self.model.get_sentence_embedding_dimension()
             logger.info(
@@ -77,18 +104,22 @@ class BertEmbedding:
             raise ValueError("模型未加载，请先调用load_model方法")
 
         # 检查缓存
-        if text in self.cache:
-            return self.cache[text]
+        with self._cache_lock:
+            embedding = self.cache.get(text)
+            if embedding is not None:
+                self.cache.move_to_end(text)
+                return embedding
 
         with torch.no_grad():
             embedding = self.model.encode(text, convert_to_numpy=True)
 
-        # 更新缓存
-        if len(self.cache) >= self.cache_size:
-            # 简单的LRU策略: 移除一个随机键
-            self.cache.pop(next(iter(self.cache)))
+        # 更新缓存，LRU策略: 移除最久未使用的键
+        with self._cache_lock:
+            self.cache[text] = embedding
+            self.cache.move_to_end(text)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
 
-        self.cache[text] = embedding
         return embedding
 
     def get_embeddings(self, texts, batch_size=32):
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""批量导入问题-SQL语料到示例向量存储
+
+以流式方式读取 JSONL 或 CSV 语料（字段 question 和 sql），按批计算嵌入向量，
+可选地并行在数据库上验证SQL，然后批量写入对应数据库的示例存储。每隔若干批
+保存一次存储并同时记录断点，中断后再次运行会从上次保存处继续。验证时数据库
+不可用会停止导入，而不是把整批记录当作验证失败跳过。
+
+用法:
+    python -m src.rag.ingest corpus.jsonl --database music --validate --workers 4
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(Exception):
+    """验证SQL时数据库不可用（连接失败或熔断中），导入停止在上次保存处"""
+
+
+def _csv_rows(f):
+    """逐行读取CSV，无法解析的行返回None（csv模块会跳过该行继续读取）"""
+    reader = csv.DictReader(f)
+    while True:
+        try:
+            yield next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            logger.warning(f"CSV 第 {reader.line_num} 行无法解析: {str(e)}")
+            yield None
+
+
+def iter_corpus(path, corpus_format=None, skip=0):
+    """流式读取语料
+
+    格式错误的记录（无法解析的 JSON 行或 CSV 行）记录日志后以空问题和
+    空SQL返回，由调用方计为跳过，不会中止导入。
+
+    Args:
+        path: 语料文件路径
+        corpus_format: "jsonl" 或 "csv"，默认根据扩展名判断
+        skip: 跳过的记录数（用于断点续传）
+
+    Yields:
+        Tuple[int, str, str]: (记录序号, 问题, SQL)
+    """
+    corpus_format = corpus_format or (
+        "csv" if path.lower().endswith(".csv") else "jsonl"
+    )
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if corpus_format == "csv":
+            records = enumerate(_csv_rows(f))
+        else:
+            records = enumerate(line for line in f if line.strip())
+
+        for index, record in records:
+            if index < skip:
+                continue
+            if corpus_format != "csv":
+                try:
+                    record = json.loads(record)
+                except ValueError as e:
+                    logger.warning(f"语料第 {index + 1} 条记录不是有效的 JSON: {str(e)}")
+                    record = None
+            if not isinstance(record, dict):
+                yield index, "", ""
+                continue
+            question = (record.get("question") or record.get("query") or "").strip()
+            sql = (record.get("sql") or "").strip()
+            yield index, question, sql
+
+
+def _load_checkpoint(checkpoint_path):
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+
+def _save_checkpoint(checkpoint_path, checkpoint):
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def ingest_corpus(
+    path,
+    database=None,
+    corpus_format=None,
+    batch_size=512,
+    embedding_batch_size=64,
+    validate=False,
+    workers=4,
+    resume=True,
+    checkpoint_path=None,
+    text2sql=None,
+    save_every=10,
+):
+    """批量导入语料到示例向量存储
+
+    Args:
+        path: 语料文件路径
+        database: 目标数据库名称，默认为None，使用默认数据库
+        corpus_format: "jsonl" 或 "csv"，默认根据扩展名判断
+        batch_size: 每批处理的记录数
+        embedding_batch_size: 计算嵌入向量时的批大小
+        validate: 是否在数据库上验证SQL，验证失败的记录不会导入
+        workers: 并行验证的线程数（受数据库连接池大小限制）
+        resume: 是否从断点继续
+        checkpoint_path: 断点文件路径，默认为 <语料路径>.<数据库>.checkpoint.json
+        text2sql: 已初始化的Text2SQL实例（可选），传入时复用其模型和数据库注册表，
+            用于在运行中的服务进程内导入
+        save_every: 每处理多少批保存一次存储并记录断点（保存会重写整个存储，
+            不宜每批都保存）；结束或出错时也会保存
+
+    Returns:
+        dict: 导入统计，包括 processed、added、duplicates、invalid、skipped
+
+    Raises:
+        DatabaseUnavailable: 验证SQL时数据库不可用，已导入的部分已保存
+    """
+    from ..database.sql_validator import SYNTAX_ONLY
+
+    if text2sql is not None:
+        embedding_model = text2sql.bert_embedding_model
+        registry = text2sql.registry
+    else:
+        from ..database.registry import DatabaseRegistry
+        from .embedding.bert_embedding_model import BertEmbedding
+
+        embedding_model = BertEmbedding()
+        registry = DatabaseRegistry()
+
+    context = registry.get(database)
+    store = context.vector_store
+    checkpoint_path = (
+        checkpoint_path or f"{path}.{context.db_name}.checkpoint.json"
+    )
+
+    stats = {"processed": 0, "added": 0, "duplicates": 0, "invalid": 0, "skipped": 0}
+    checkpoint = _load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint:
+        stats.update(checkpoint["stats"])
+        logger.info(f"从断点继续导入，已处理 {stats['processed']} 条记录")
+
+    if store.max_size:
+        logger.info(f"示例存储容量上限为 {store.max_size}，超出部分将按淘汰策略移除")
+
+    executor = ThreadPoolExecutor(max_workers=workers) if validate else None
+    started = time.monotonic()
+    start_count = stats["processed"]
+    unsaved_batches = 0
+
+    def save():
+        """保存存储并记录与之对应的断点"""
+        nonlocal unsaved_batches
+        store.save()
+        _save_checkpoint(checkpoint_path, {"path": path, "stats": stats})
+        unsaved_batches = 0
+
+    def flush(batch):
+        nonlocal unsaved_batches
+        questions, sqls = [], []
+        for _, question, sql in batch:
+            if question and sql:
+                questions.append(question)
+                sqls.append(sql)
+            else:
+                stats["skipped"] += 1
+
+        if questions and validate:
+            results = list(executor.map(context.sql_validator.validate, sqls))
+            # 数据库不可用时验证降级为仅语法检查，不能据此判断记录是否有效
+            if any(validation == SYNTAX_ONLY for _, _, _, validation in results):
+                raise DatabaseUnavailable(
+                    f"验证SQL时数据库 {context.db_name} 不可用，导入停止在第 "
+                    f"{stats['processed']} 条记录，恢复后重新运行即可继续"
+                )
+            valid = [i for i, (ok, _, _, _) in enumerate(results) if ok]
+            stats["invalid"] += len(questions) - len(valid)
+            questions = [questions[i] for i in valid]
+            sqls = [sqls[i] for i in valid]
+
+        if questions:
+            vectors = embedding_model.get_embeddings(
+                questions, batch_size=embedding_batch_size
+            )
+            metadata_list = [
+                {"question": question, "sql": sql, "source": "ingest"}
+                for question, sql in zip(questions, sqls)
+            ]
+            added = store.upsert_many(list(vectors), metadata_list)
+            stats["added"] += added
+            stats["duplicates"] += len(questions) - added
+
+        stats["processed"] += len(batch)
+        unsaved_batches += 1
+        if unsaved_batches >= save_every:
+            save()
+
+        elapsed = time.monotonic() - started
+        rate = (stats["processed"] - start_count) / elapsed if elapsed else 0
+        logger.info(
+            f"已处理 {stats['processed']} 条 ({rate:.0f} 条/秒)，新增 {stats['added']}，"
+            f"重复 {stats['duplicates']}，验证失败 {stats['invalid']}，跳过 {stats['skipped']}"
+        )
+
+    try:
+        batch = []
+        for record in iter_corpus(path, corpus_format, skip=stats["processed"]):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        # 出错时也保存已完成的批次，断点与存储保持一致
+        if unsaved_batches:
+            save()
+
+    logger.info(f"语料导入完成: {stats}")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量导入问题-SQL语料到示例向量存储")
+    parser.add_argument("path", help="JSONL 或 CSV 语料文件，包含 question 和 sql 字段")
+    parser.add_argument("--database", default=None, help="目标数据库，默认使用 DB_NAME")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--embedding-batch-size", type=int, default=64)
+    parser.add_argument("--validate", action="store_true", help="在数据库上验证SQL")
+    parser.add_argument("--workers", type=int, default=4, help="并行验证的线程数")
+    parser.add_argument("--no-resume", action="store_true", help="忽略断点，从头导入")
+    parser.add_argument("--checkpoint", default=None, help="断点文件路径")
+    parser.add_argument(
+        "--save-every", type=int, default=10, help="每处理多少批保存一次存储和断点"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    ingest_corpus(
+        args.path,
+        database=args.database,
+        corpus_format=args.format,
+        batch_size=args.batch_size,
+        embedding_batch_size=args.embedding_batch_size,
+        validate=args.validate,
+        workers=args.workers,
+        resume=not args.no_resume,
+        checkpoint_path=args.checkpoint,
+        save_every=args.save_every,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""基于已验证示例的模板SQL合成
+
+很多问题只是取值不同（"2023年" 与 "2024年"、不同的歌手名）。对检索到的
+相似示例，把SQL中同样出现在问题里的字面量（字符串、数字）视为槽位，
+把示例问题中槽位之外的部分作为常量与新问题对齐：常量部分必须完全一致，
+槽位对应的新文本即为新的取值，填回SQL即可得到新问题的SQL，无需调用LLM。
+"""
+import logging
+import re
+import unicodedata
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# SQL中的字符串字面量和数字字面量（不匹配标识符中的数字，如 album_2023）
+_LITERAL_PATTERN = re.compile(
+    r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])"
+)
+_NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+# 紧跟在 LIMIT/OFFSET（或 LIMIT a, b 的逗号）之后的数字是行数，不是问题中的取值
+_ROW_COUNT_PATTERN = re.compile(r"(?:\b(?:LIMIT|OFFSET)\s+|\bLIMIT\s+\d+\s*,\s*)$", re.IGNORECASE)
+# 槽位取值中出现这些分隔符时说明新问题列举了多个取值，一个字面量无法表达
+_SEPARATOR_PATTERN = re.compile(r"[和、,，;；/&]|及|与|或|\b(?:and|or)\b", re.IGNORECASE)
+
+
+def _normalize(question):
+    """统一全角/半角并合并空白，保留大小写（字符串取值区分大小写）"""
+    text = unicodedata.normalize("NFKC", question or "").strip()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip("?？.。!！ ")
+
+
+def _unquote(literal):
+    """去掉字符串字面量的引号并还原转义"""
+    quote = literal[0]
+    body = literal[1:-1]
+    return body.replace(quote * 2, quote).replace("\\" + quote, quote)
+
+
+def _quote(value, quote):
+    """把取值转义为字符串字面量"""
+    return quote + value.replace("\\", "\\\\").replace(quote, quote * 2) + quote
+
+
+def _find_unique(question, value, numeric):
+    """在问题中查找取值唯一的出现位置
+
+    Returns:
+        int或None: 起始位置；找不到或出现多次（无法确定对应关系）时为None
+    """
+    lowered, target = question.lower(), value.lower()
+    positions = []
+    start = lowered.find(target)
+    while start != -1:
+        end = start + len(target)
+        # 数字两侧不能紧邻其他数字，避免 "1" 匹配到 "10" 中
+        if not numeric or (
+            (start == 0 or not lowered[start - 1].isdigit())
+            and (end == len(lowered) or not lowered[end].isdigit())
+        ):
+            positions.append(start)
+        start = lowered.find(target, start + 1)
+    return positions[0] if len(positions) == 1 else None
+
+
+class SQLTemplate:
+    """由一个问题-SQL示例得到的模板
+
+    为避免生成执行得通但语义错误的SQL，以下情况不作为槽位：在SQL中出现
+    多次的取值、LIMIT/OFFSET 的行数、不在问题中出现的数字；两个字面量
+    取值相同时（无法确定对应关系）不构建模板。
+
+    Attributes:
+        question: 规范化后的示例问题
+        sql: 示例SQL
+        slots: 槽位列表，每项为 (问题中的起止位置, SQL中各出现位置的列表, 是否为数字, 引号)
+        pattern: 匹配同形问题的正则表达式，没有槽位时为None
+    """
+
+    def __init__(self, question, sql):
+        self.question = _normalize(question)
+        self.sql = sql
+        self.slots = []
+
+        by_value = {}
+        for match in _LITERAL_PATTERN.finditer(sql):
+            literal = match.group(0)
+            quote = literal[0] if literal[0] in "'\"" else None
+            value = _unquote(literal) if quote else literal
+            if not value.strip():
+                continue
+            row_count = quote is None and _ROW_COUNT_PATTERN.search(
+                sql, 0, match.start()
+            )
+            by_value.setdefault(value.lower(), []).append(
+                (match.span(), quote, bool(row_count))
+            )
+
+        # 长的取值优先，避免 "20" 抢占 "2023" 的位置
+        taken = []
+        for value, occurrences in sorted(by_value.items(), key=lambda item: -len(item[0])):
+            start = _find_unique(self.question, value, occurrences[0][1] is None)
+            if start is None:
+                continue
+            if len(occurrences) > 1:
+                # 同一取值出现多次（包括 LIMIT 中的相同数字），无法确定哪些随问题变化
+                self.slots = []
+                break
+            span, quote, row_count = occurrences[0]
+            if row_count:
+                continue
+            end = start + len(value)
+            if any(start < e and s < end for s, e in taken):
+                continue
+            taken.append((start, end))
+            self.slots.append(((start, end), [span], quote is None, quote))
+
+        self.slots.sort(key=lambda slot: slot[0][0])
+
+        # 槽位之外的常量部分原样匹配，槽位匹配任意非空文本
+        self.pattern = None
+        if self.slots:
+            parts, previous = [], 0
+            for (start, end), _, _, _ in self.slots:
+                parts.append(re.escape(self.question[previous:start]))
+                parts.append("(.+?)")
+                previous = end
+            parts.append(re.escape(self.question[previous:]))
+            self.pattern = re.compile("".join(parts), re.IGNORECASE)
+
+    def fill(self, question):
+        """把新问题与模板对齐并生成SQL
+
+        Args:
+            question: 新问题
+
+        Returns:
+            str或None: 生成的SQL；槽位之外的文本不一致或取值不合法时为None
+        """
+        if self.pattern is None:
+            return None
+        match = self.pattern.fullmatch(_normalize(question))
+        if match is None:
+            return None
+
+        replacements = []
+        for index, ((start, end), sql_spans, numeric, quote) in enumerate(self.slots):
+            value = match.group(index + 1).strip()
+            original = self.question[start:end]
+            if not value:
+                return None
+            # 新取值中出现原取值没有的分隔符或空白时，说明它不是单个取值
+            if _SEPARATOR_PATTERN.search(value) and not _SEPARATOR_PATTERN.search(
+                original
+            ):
+                return None
+            if any(c.isspace() for c in value) and not any(
+                c.isspace() for c in original
+            ):
+                return None
+            if numeric:
+                if not _NUMBER_PATTERN.fullmatch(value):
+                    return None
+                literal = value
+            else:
+                literal = _quote(value, quote)
+            replacements.extend((span, literal) for span in sql_spans)
+
+        sql = self.sql
+        for (start, end), literal in sorted(replacements, reverse=True):
+            sql = sql[:start] + literal + sql[end:]
+        return sql
+
+
+@lru_cache(maxsize=4096)
+def build_template(question, sql):
+    """构建（并缓存）示例的模板"""
+    return SQLTemplate(question, sql)
+
+
+def synthesize_sql(question, examples):
+    """尝试由相似示例的模板直接生成SQL
+
+    Args:
+        question: 新问题
+        examples: 相似示例的元数据列表（按相似度降序），需包含 question 和 sql
+
+    Returns:
+        Tuple[str, dict]或None: 生成的SQL及所用的示例；所有示例都无法对齐时为None
+    """
+    for example in examples:
+        if not isinstance(example, dict):
+            continue
+        if not example.get("question") or not example.get("sql"):
+            continue
+        try:
+            sql = build_template(example["question"], example["sql"]).fill(question)
+        except Exception as e:
+            logger.warning(f"模板对齐失败: {str(e)}")
+            continue
+        if sql:
+            logger.info(f"由示例模板生成SQL: {example['question']}")
+            return sql, example
+    return None
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""向量压缩编码
+
+对归一化后的向量做有损压缩，用压缩形式近似计算余弦相似度，再由调用方
+对得分最高的候选用原始向量精确重排：
+- float16: 半精度，体积为 float32 的 1/2
+- int8: 每个向量按自身最大绝对值缩放到 [-127, 127]，体积约为 1/4
+- pca: 在已存储的数据上拟合主成分，降到 dim 维（float32）
+
+编码结果是若干个首维为行数的数组组成的元组，便于按行追加和按行取子集。
+"""
+import numpy as np
+
+# 近似打分时每次转换为 float32 的行数，分块较小时临时数组可留在CPU缓存中
+SCORE_CHUNK_ROWS = 1024
+
+
+class VectorCodec:
+    """向量编码基类"""
+
+    name = None
+    # 拟合所需的最少行数，不需要拟合的编码为0
+    min_fit_rows = 0
+
+    def fit(self, vectors):
+        """在已有向量上拟合编码参数
+
+        Args:
+            vectors: 归一化后的向量矩阵
+
+        Returns:
+            VectorCodec: 拟合好的新编码器（不修改当前实例，已发布的快照仍可使用旧参数）
+        """
+        return self
+
+    def empty(self, capacity, dim):
+        """分配可容纳 capacity 行的空编码数组元组"""
+        raise NotImplementedError
+
+    def encode(self, vectors):
+        """编码归一化后的向量矩阵，返回编码数组元组"""
+        raise NotImplementedError
+
+    def scores(self, codes, query, size, rows=None):
+        """用编码近似计算余弦相似度
+
+        Args:
+            codes: 编码数组元组
+            query: 归一化后的一维查询向量
+            size: 有效行数
+            rows: 只计算这些行，默认为全部有效行
+
+        Returns:
+            numpy数组: 近似相似度
+        """
+        if rows is not None:
+            return self._scores([array[rows] for array in codes], query)
+        results = []
+        for start in range(0, size, SCORE_CHUNK_ROWS):
+            end = min(start + SCORE_CHUNK_ROWS, size)
+            results.append(self._scores([array[start:end] for array in codes], query))
+        return np.concatenate(results) if results else np.empty(0, np.float32)
+
+    def _scores(self, codes, query):
+        raise NotImplementedError
+
+
+class Float16Codec(VectorCodec):
+    """半精度编码"""
+
+    name = "float16"
+
+    def empty(self, capacity, dim):
+        return (np.empty((capacity, dim), dtype=np.float16),)
+
+    def encode(self, vectors):
+        return (np.asarray(vectors, dtype=np.float16),)
+
+    def _scores(self, codes, query):
+        return codes[0].astype(np.float32) @ query
+
+
+class Int8Codec(VectorCodec):
+    """按向量缩放的 int8 编码"""
+
+    name = "int8"
+
+    def empty(self, capacity, dim):
+        return (
+            np.empty((capacity, dim), dtype=np.int8),
+            np.empty(capacity, dtype=np.float32),
+        )
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def _scores(self, codes, query):
+        quantized, scales = codes
+        return (quantized.astype(np.float32) @ query) * scales
+
+
+class PCACodec(VectorCodec):
+    """主成分降维编码
+
+    向量近似为 mean + components.T @ code，因此
+    x·q ≈ mean·q + code·(components @ q)，打分只需一次降维后的矩阵乘法。
+    """
+
+    name = "pca"
+
+    def __init__(self, dim=128, sample_size=20000):
+        """初始化
+
+        Args:
+            dim: 降维后的维度
+            sample_size: 拟合时最多使用的样本数
+        """
+        self.dim = dim
+        self.sample_size = sample_size
+        self.min_fit_rows = max(2 * dim, 256)
+        self.mean = None
+        self.components = None
+
+    def fit(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) > self.sample_size:
+            rng = np.random.default_rng(0)
+            vectors = vectors[rng.choice(len(vectors), self.sample_size, replace=False)]
+        codec = PCACodec(self.dim, self.sample_size)
+        codec.mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - codec.mean, full_matrices=False)
+        codec.components = np.ascontiguousarray(vt[: self.dim], dtype=np.float32)
+        return codec
+
+    def empty(self, capacity, dim):
+        return (np.empty((capacity, len(self.components)), dtype=np.float32),)
+
+    def encode(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return ((vectors - self.mean) @ self.components.T,)
+
+    def _scores(self, codes, query):
+        return codes[0] @ (self.components @ query) + float(self.mean @ query)
+
+
+def create_codec(name, pca_dim=128):
+    """按名称创建编码器
+
+    Args:
+        name: "none"、"float16"、"int8" 或 "pca"
+        pca_dim: pca 编码的目标维度
+
+    Returns:
+        VectorCodec或None: name 为 "none" 或空时返回None
+
+    Raises:
+        ValueError: 未知的编码名称
+    """
+    if not name or name == "none":
+        return None
+    if name == "float16":
+        return Float16Codec()
+    if name == "int8":
+        return Int8Codec()
+    if name == "pca":
+        return PCACodec(pca_dim)
+    raise ValueError(f"未知的向量压缩方式: {name}")
+
+
+def codes_nbytes(codes, size):
+    """编码前 size 行占用的字节数"""
+    return sum(array[:size].nbytes for array in codes)
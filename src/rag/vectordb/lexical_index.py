@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+from ...utils.text import normalize_question
+
+# 连续的中日韩字符，或连续的字母数字
+_TOKEN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff]+|[a-z0-9_]+")
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff]")
+
+
+def tokenize(text):
+    """把问题切分为词项
+
+    中文没有空格分词，连续的中文字符切成单字和相邻两字（如 "专辑" 得到
+    "专"、"辑"、"专辑"）；字母数字按整词保留（如表名、列名）。
+
+    Args:
+        text: 原始问题
+
+    Returns:
+        list: 词项列表
+    """
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(normalize_question(text)):
+        if _CJK_PATTERN.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def _append(arrays, count, values):
+    """向按需倍增的数组组追加一行，返回新的 (数组组, 条数)
+
+    只写入已发布条数之外的位置，扩容时复制到新数组，读者持有的旧数组不受影响。
+    """
+    if count >= len(arrays[0]):
+        grown = []
+        for array in arrays:
+            new = np.empty(max(4, len(array) * 2), dtype=array.dtype)
+            new[:count] = array[:count]
+            grown.append(new)
+        arrays = tuple(grown)
+    for array, value in zip(arrays, values):
+        array[count] = value
+    return arrays, count + 1
+
+
+class BM25Index:
+    """示例问题的 BM25 词法索引
+
+    与向量矩阵相同，倒排表和行长度保存在按需倍增的数组中，每次追加后
+    整体替换 (数组, 条数) 元组，读者按快照条数截断即可无锁读取；
+    删除和压缩时整体重建。
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        """初始化空索引
+
+        Args:
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        # 词项 -> ((行号数组, 词频数组), 条数)
+        self._postings = {}
+        # ((每行的词项数数组,), 条数)
+        self._lengths = ((np.empty(0, dtype=np.float32),), 0)
+
+    @classmethod
+    def build(cls, metadata_list):
+        """根据元数据列表中的问题构建索引"""
+        index = cls()
+        for row, metadata in enumerate(metadata_list):
+            index.add(row, metadata)
+        return index
+
+    def add(self, row, metadata):
+        """把一行的问题加入索引，行号必须按顺序递增"""
+        question = metadata.get("question") if isinstance(metadata, dict) else None
+        tokens = tokenize(question) if question else []
+        for term, tf in Counter(tokens).items():
+            arrays, count = self._postings.get(term) or (
+                (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)),
+                0,
+            )
+            self._postings[term] = _append(arrays, count, (row, tf))
+        self._lengths = _append(*self._lengths, (len(tokens),))
+
+    def scores(self, text, size):
+        """计算问题与前 size 行的 BM25 得分
+
+        Args:
+            text: 查询问题
+            size: 快照条数，只计算小于该值的行
+
+        Returns:
+            Tuple[numpy数组, numpy数组]: 得分大于0的行号（升序）及其得分
+        """
+        (lengths,), count = self._lengths
+        size = min(size, count)
+        if size == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        lengths = lengths[:size]
+        average_length = max(float(lengths.mean()), 1.0)
+
+        all_rows, all_scores = [], []
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            (rows, tfs), count = postings
+            # 行号递增，只保留快照范围内的行
+            count = int(np.searchsorted(rows[:count], size))
+            if count == 0:
+                continue
+            rows, tfs = rows[:count], tfs[:count]
+
+            idf = math.log(1 + (size - count + 0.5) / (count + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[rows] / average_length)
+            all_rows.append(rows)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        if not all_rows:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        scores = np.bincount(
+            np.concatenate(all_rows), weights=np.concatenate(all_scores), minlength=size
+        )
+        rows = np.flatnonzero(scores)
+        return rows, scores[rows].astype(np.float32)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# 建立倒排索引的元数据字段
+INDEXED_FIELDS = ("database", "tables", "success", "source")
+
+
+def _normalize_value(value):
+    """统一索引键：字符串不区分大小写"""
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
+def _field_values(metadata, field):
+    """取出元数据中某字段的全部索引键，列表字段的每个元素各为一个键"""
+    if not isinstance(metadata, dict):
+        return []
+    value = metadata.get(field)
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [_normalize_value(item) for item in value]
+    return [_normalize_value(value)]
+
+
+class MetadataIndex:
+    """元数据倒排索引：字段取值 -> 行号列表
+
+    行号列表只追加（或在写锁内删除单个元素），读者在快照上读取时只需丢弃
+    大于等于快照条数的行号，因此无需加锁。删除和压缩会整体重建索引。
+    """
+
+    def __init__(self, fields=INDEXED_FIELDS):
+        """初始化空索引
+
+        Args:
+            fields: 建立索引的字段
+        """
+        self.fields = tuple(fields)
+        self._postings = {field: {} for field in self.fields}
+
+    @classmethod
+    def build(cls, metadata_list, fields=INDEXED_FIELDS):
+        """根据元数据列表构建索引
+
+        Args:
+            metadata_list: 元数据列表，下标即行号
+            fields: 建立索引的字段
+
+        Returns:
+            MetadataIndex: 新索引
+        """
+        index = cls(fields)
+        for row, metadata in enumerate(metadata_list):
+            index.add(row, metadata)
+        return index
+
+    def add(self, row, metadata):
+        """把一行加入索引"""
+        for field in self.fields:
+            postings = self._postings[field]
+            for value in set(_field_values(metadata, field)):
+                postings.setdefault(value, []).append(row)
+
+    def remove(self, row, metadata):
+        """从索引中移除一行在 metadata 中各字段取值下的记录"""
+        for field in self.fields:
+            postings = self._postings[field]
+            for value in set(_field_values(metadata, field)):
+                rows = postings.get(value)
+                if rows and row in rows:
+                    rows.remove(row)
+
+    def candidates(self, filters, size):
+        """计算满足过滤条件的行号
+
+        不同字段之间取交集；同一字段给出多个取值（列表）时取并集，例如
+        {"tables": ["orders", "users"]} 匹配引用了其中任一张表的示例。
+
+        Args:
+            filters: 字段 -> 取值或取值列表
+            size: 快照条数，只返回小于该值的行号
+
+        Returns:
+            numpy数组: 升序排列的行号
+
+        Raises:
+            ValueError: 过滤字段没有建立索引
+        """
+        result = None
+        for field, value in filters.items():
+            if field not in self._postings:
+                raise ValueError(f"不支持按字段过滤: {field}")
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            postings = self._postings[field]
+
+            rows = [
+                np.array(postings.get(_normalize_value(item), ()), dtype=np.int64)
+                for item in values
+            ]
+            rows = np.unique(np.concatenate(rows)) if rows else np.empty(0, np.int64)
+            rows = rows[rows < size]
+
+            result = rows if result is None else np.intersect1d(
+                result, rows, assume_unique=True
+            )
+            if len(result) == 0:
+                break
+
+        if result is None:
+            return np.arange(size, dtype=np.int64)
+        return result
@@ -0,0 +1,600 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+
+import numpy as np
+
+from .lexical_index import BM25Index
+from .metadata_index import MetadataIndex
+from .vector_store import InMemoryVectorStore, get_store_path
+from ...config import Config
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+
+def get_snapshot_dir(partition=None, root=None):
+    """获取分区的快照目录
+
+    Args:
+        partition: 分区名称，默认为None，使用默认分区
+        root: 快照根目录，默认为 data/vector_store_shared
+
+    Returns:
+        str: 快照目录
+    """
+    return os.path.join(root or "data/vector_store_shared", partition or "default")
+
+
+class SharedVectorStore(InMemoryVectorStore):
+    """多进程共享的只读向量存储
+
+    供多个 worker 进程使用：向量以内存映射文件的形式读取，同一份物理页由
+    操作系统在所有 worker 之间共享；写入不在本进程执行，而是通过队列交给
+    唯一的 VectorStoreWriter 进程，写入方发布新快照后各 worker 自动重新映射。
+    """
+
+    def __init__(
+        self, write_queue, partition=None, snapshot_dir=None, refresh_interval=None
+    ):
+        """初始化共享向量存储
+
+        Args:
+            write_queue: 发送给写入进程的 multiprocessing 队列
+            partition: 分区名称（数据库名称），默认为None，使用默认分区
+            snapshot_dir: 快照根目录，默认为 data/vector_store_shared
+            refresh_interval: 后台检查新快照的间隔秒数，默认为配置中的
+                VECTOR_STORE_PUBLISH_INTERVAL
+        """
+        super().__init__(save_path=get_store_path(partition))
+        self.write_queue = write_queue
+        self.partition = partition
+        self.snapshot_dir = get_snapshot_dir(partition, snapshot_dir)
+        self.manifest_path = os.path.join(self.snapshot_dir, MANIFEST_NAME)
+        # (归一化向量矩阵, 元数据列表, 元数据倒排索引, BM25索引, 压缩编码)，
+        # 整体替换以保证多线程读取一致
+        self._shared = (
+            np.empty((0, 0), dtype=np.float32), [], MetadataIndex(), BM25Index(), None
+        )
+        self.generation = None
+        self._manifest = None
+        self._manifest_stat = None
+        self._refresh_lock = threading.Lock()
+        self.refresh_interval = (
+            Config.VECTOR_STORE_PUBLISH_INTERVAL
+            if refresh_interval is None
+            else refresh_interval
+        )
+        self._watcher_lock = threading.Lock()
+        self._watcher_pid = None
+
+        # 通知写入进程加载并发布该分区的现有数据
+        self.write_queue.put((partition, None, None))
+
+    def _refresh(self):
+        """确保本进程的后台线程在检查新快照
+
+        读取快照需要反序列化全部元数据和索引，只在尚未映射任何快照时在
+        当前线程执行，之后的新快照都由后台线程读取后整体替换。其他线程
+        正在读取时直接使用当前快照，不等待。
+        """
+        self._start_watcher()
+        if self.generation is not None:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._check_manifest()
+        finally:
+            self._refresh_lock.release()
+
+    def _start_watcher(self):
+        """在本进程中启动检查新快照的后台线程（线程不会跨 fork 继承）"""
+        if self._watcher_pid == os.getpid():
+            return
+        with self._watcher_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            # fork 时父进程的后台线程可能正持有该锁
+            self._refresh_lock = threading.Lock()
+            self._watcher_pid = os.getpid()
+
+            def run():
+                while True:
+                    time.sleep(self.refresh_interval)
+                    try:
+                        with self._refresh_lock:
+                            self._check_manifest()
+                    except Exception as e:
+                        logger.error(f"读取向量存储快照失败: {str(e)}")
+
+            threading.Thread(
+                target=run, name="vector-store-refresh", daemon=True
+            ).start()
+
+    def _check_manifest(self):
+        """读取快照清单，发现新快照时重新映射"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return
+
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._manifest_stat:
+            return
+
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+
+            # 写入进程重启后代号会重新计数，因此比较整个清单而不只是代号
+            if manifest != self._manifest:
+                if manifest["count"]:
+                    vectors = np.load(
+                        os.path.join(self.snapshot_dir, manifest["vectors"]),
+                        mmap_mode="r",
+                    )
+                else:
+                    # 空文件无法映射
+                    vectors = np.empty((0, 0), dtype=np.float32)
+                with open(
+                    os.path.join(self.snapshot_dir, manifest["metadata"]), "rb"
+                ) as f:
+                    metadata = pickle.load(f)
+                if manifest.get("indexes"):
+                    # 索引由写入进程随快照发布，读取远快于在请求线程中重建
+                    with open(
+                        os.path.join(self.snapshot_dir, manifest["indexes"]), "rb"
+                    ) as f:
+                        metadata_index, lexical_index = pickle.load(f)
+                else:
+                    metadata_index = MetadataIndex.build(metadata)
+                    lexical_index = BM25Index.build(metadata)
+
+                codes = None
+                if manifest["count"] and manifest.get("codes"):
+                    # 压缩编码同样以内存映射读取，原始向量只在精确重排时按行读取
+                    with open(
+                        os.path.join(self.snapshot_dir, manifest["codec"]), "rb"
+                    ) as f:
+                        codec = pickle.load(f)
+                    arrays = tuple(
+                        np.load(os.path.join(self.snapshot_dir, name), mmap_mode="r")
+                        for name in manifest["codes"]
+                    )
+                    codes = (codec, arrays)
+
+                self._shared = (
+                    vectors,
+                    metadata,
+                    metadata_index,
+                    lexical_index,
+                    codes,
+                )
+                self.generation = manifest["generation"]
+                self._manifest = manifest
+                logger.info(
+                    f"已映射向量存储快照 #{self.generation}，共 {len(metadata)} 个向量"
+                )
+
+            self._manifest_stat = stat_key
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            # 写入进程正在替换快照，下次调用时重试
+            logger.debug(f"读取向量存储快照失败，稍后重试: {str(e)}")
+
+    def add_vector(self, vector, metadata):
+        """将向量及其元数据发送给写入进程
+
+        Args:
+            vector: numpy数组，表示文本的嵌入向量
+            metadata: 与向量关联的元数据（例如问题-SQL对）
+        """
+        vector = np.asarray(vector, dtype=np.float32).flatten()
+        self.write_queue.put((self.partition, vector, metadata))
+
+    def upsert(self, vector, metadata):
+        """将示例发送给写入进程，由写入进程执行去重和容量限制
+
+        Args:
+            vector: numpy数组，表示文本的嵌入向量
+            metadata: 与向量关联的元数据（例如问题-SQL对）
+
+        Returns:
+            bool: 始终为True，表示已提交给写入进程
+        """
+        self.add_vector(vector, metadata)
+        return True
+
+    def upsert_many(self, vectors, metadata_list):
+        """将一批示例发送给写入进程
+
+        Args:
+            vectors: 向量列表
+            metadata_list: 元数据列表
+
+        Returns:
+            int: 提交的示例数量
+        """
+        for vector, metadata in zip(vectors, metadata_list):
+            self.add_vector(vector, metadata)
+        return len(metadata_list)
+
+    def compact(self):
+        """压缩由写入进程定期执行"""
+        return 0
+
+    def search(self, query_vector, top_k=5, filters=None, query_text=None):
+        """搜索与查询向量最相似的向量
+
+        快照中的向量已由写入进程归一化，直接在映射的矩阵上做点积，
+        不会把共享页复制到本进程；给出 filters 时只读取匹配的行。
+        检索到的示例的使用记录发送给写入进程更新。
+
+        Args:
+            query_vector: 查询向量
+            top_k: 返回的最相似向量数量
+            filters: 元数据过滤条件，同 InMemoryVectorStore.search
+            query_text: 查询问题原文，同 InMemoryVectorStore.search
+
+        Returns:
+            列表，包含元组(得分, 元数据)，按得分降序排序
+        """
+        self._refresh()
+        vectors, metadata, metadata_index, lexical_index, codes = self._shared
+
+        if len(metadata) == 0:
+            logger.warning("向量存储为空，无法执行搜索")
+            return []
+
+        rows, lexical = self._candidate_rows(
+            metadata_index, lexical_index, len(metadata), top_k, filters, query_text
+        )
+        if rows is not None and len(rows) == 0:
+            return []
+
+        query_vector = np.asarray(query_vector, dtype=np.float32).flatten()
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return []
+
+        rows = self._rerank_rows(codes, query_vector, len(metadata), top_k, rows, lexical)
+        matrix = vectors if rows is None else vectors[rows]
+        scores = self._fuse_scores(matrix @ (query_vector / norm), rows, lexical)
+
+        top_k = min(top_k, len(scores))
+        top_indices = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
+
+        results = [
+            (scores[i], metadata[i if rows is None else rows[i]])
+            for i in top_indices
+        ]
+
+        # 映射的元数据是只读副本，检索记录交给写入进程，使淘汰策略与单进程一致
+        questions = [
+            item.get("question")
+            for _, item in results
+            if isinstance(item, dict) and item.get("question")
+        ]
+        if questions:
+            self.write_queue.put(
+                (self.partition, None, {"hits": questions, "time": time.time()})
+            )
+        return results
+
+    def clear(self):
+        """共享存储由写入进程维护，worker 中不允许清空"""
+        raise NotImplementedError("共享向量存储只能由写入进程修改")
+
+    def save(self):
+        """持久化由写入进程负责，worker 中无需保存"""
+
+    def load(self):
+        """映射写入进程发布的最新快照
+
+        Returns:
+            bool: 是否已有可用快照
+        """
+        self._refresh()
+        return self.generation is not None
+
+    def __len__(self):
+        """返回存储的向量数量"""
+        self._refresh()
+        return len(self._shared[1])
+
+
+class VectorStoreWriter:
+    """向量存储唯一写入进程
+
+    从队列中批量读取新示例，写入各分区规范的 InMemoryVectorStore 并保存，
+    然后将归一化后的向量矩阵发布为内存映射快照，供 SharedVectorStore 读取。
+    """
+
+    def __init__(
+        self,
+        snapshot_dir=None,
+        batch_size=64,
+        keep_generations=2,
+        compact_interval=None,
+        publish_interval=None,
+    ):
+        """初始化写入进程
+
+        Args:
+            snapshot_dir: 快照根目录，默认为 data/vector_store_shared
+            batch_size: 每次最多合并写入的示例数量
+            keep_generations: 保留的历史快照数量，避免 worker 读取时文件已被删除
+            compact_interval: 压缩间隔秒数，默认为配置中的VECTOR_STORE_COMPACT_INTERVAL
+            publish_interval: 发布快照的最短间隔秒数，默认为配置中的
+                VECTOR_STORE_PUBLISH_INTERVAL
+        """
+        self.snapshot_dir = snapshot_dir
+        self.compact_interval = (
+            Config.VECTOR_STORE_COMPACT_INTERVAL
+            if compact_interval is None
+            else compact_interval
+        )
+        self.publish_interval = (
+            Config.VECTOR_STORE_PUBLISH_INTERVAL
+            if publish_interval is None
+            else publish_interval
+        )
+        self.batch_size = batch_size
+        self.keep_generations = keep_generations
+        self.context = multiprocessing.get_context("fork")
+        self.queue = self.context.Queue()
+        self.process = None
+        self.stores = {}
+        self.generations = {}
+
+    def start(self):
+        """启动写入进程（需在加载模型和 fork worker 之前调用）"""
+        self.process = self.context.Process(
+            target=self._run, name="vector-store-writer", daemon=True
+        )
+        self.process.start()
+        logger.info(f"向量存储写入进程已启动，PID: {self.process.pid}")
+
+    def ensure_running(self):
+        """写入进程意外退出时重新启动（由主进程定期调用）
+
+        各分区在收到下一个示例时从磁盘上的规范存储重新加载。
+
+        Returns:
+            bool: 是否重新启动了写入进程
+        """
+        if self.process is None or self.process.is_alive():
+            return False
+        logger.warning(
+            f"向量存储写入进程 {self.process.pid} 意外退出，"
+            f"状态码: {self.process.exitcode}，正在重启"
+        )
+        # 只有写入进程读取队列，它在等待示例时被强制终止会留下未释放的读锁
+        # 读锁空闲时先取得再释放，被占用时直接释放
+        self.queue._rlock.acquire(block=False)
+        self.queue._rlock.release()
+        self.start()
+        return True
+
+    def stop(self, timeout=10):
+        """通知写入进程处理完剩余示例后退出
+
+        Args:
+            timeout: 等待进程退出的秒数
+        """
+        if self.process is None:
+            return
+        self.queue.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logger.warning("向量存储写入进程未能按时退出，强制终止")
+            self.process.terminate()
+        self.process = None
+
+    def create_reader(self, partition=None):
+        """创建连接到本写入进程的共享向量存储
+
+        Args:
+            partition: 分区名称（数据库名称），默认为None，使用默认分区
+
+        Returns:
+            SharedVectorStore: 共享向量存储实例
+        """
+        return SharedVectorStore(
+            self.queue, partition=partition, snapshot_dir=self.snapshot_dir
+        )
+
+    def _run(self):
+        """写入进程主循环"""
+        # 终端 Ctrl-C 会发给整个进程组，写入进程只响应 stop() 发送的结束标记
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        running = True
+        next_compact = (
+            time.monotonic() + self.compact_interval if self.compact_interval else None
+        )
+        # 每次发布都要重写整个快照，worker 也要重新读取，因此间隔内的
+        # 新示例合并为一次发布
+        pending = set()
+        next_publish = 0.0
+        while running:
+            now = time.monotonic()
+            if next_compact is not None and now >= next_compact:
+                self._compact_all()
+                next_compact = time.monotonic() + self.compact_interval
+            if pending and now >= next_publish:
+                self._flush(pending)
+                pending.clear()
+                next_publish = time.monotonic() + self.publish_interval
+
+            deadlines = [next_compact] if next_compact is not None else []
+            if pending:
+                deadlines.append(next_publish)
+            timeout = (
+                max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            )
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if item is None:
+                running = False
+
+            # 单个示例或分区出错只记录日志，不能让写入进程退出，
+            # 否则之后所有 worker 提交的示例都会丢失
+            for partition, vector, metadata in batch:
+                try:
+                    if partition not in self.stores:
+                        self._open_partition(partition)
+                    if vector is not None:
+                        self.stores[partition].upsert(vector, metadata)
+                        pending.add(partition)
+                    elif metadata is not None:
+                        # 检索记录只影响淘汰顺序，随下次保存一起持久化
+                        self.stores[partition].record_hits(
+                            metadata["hits"], metadata["time"]
+                        )
+                except Exception as e:
+                    logger.error(
+                        f"写入向量存储分区 {partition or 'default'} 失败: {str(e)}"
+                    )
+
+        self._flush(pending)
+        logger.info("向量存储写入进程已退出")
+
+    def _flush(self, partitions):
+        """保存有新示例的分区并发布新快照
+
+        Args:
+            partitions: 分区名称集合
+        """
+        for partition in partitions:
+            try:
+                self.stores[partition].save()
+                self._publish(partition)
+            except Exception as e:
+                logger.error(f"保存向量存储分区 {partition or 'default'} 失败: {str(e)}")
+
+    def _compact_all(self):
+        """压缩所有分区，有变化时保存并发布新快照"""
+        for partition, store in self.stores.items():
+            try:
+                if store.compact():
+                    store.save()
+                    self._publish(partition)
+            except Exception as e:
+                logger.error(f"压缩向量存储分区 {partition or 'default'} 失败: {str(e)}")
+
+    def _open_partition(self, partition):
+        """加载分区的规范存储并发布首个快照
+
+        Args:
+            partition: 分区名称
+        """
+        store = InMemoryVectorStore(save_path=get_store_path(partition))
+        store.load()
+        self.stores[partition] = store
+        snapshot_dir = get_snapshot_dir(partition, self.snapshot_dir)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        # 写入进程被重启时从上一个快照的代号继续，避免覆盖 worker 仍在映射的文件
+        manifest_path = os.path.join(snapshot_dir, MANIFEST_NAME)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.generations[partition] = json.load(f)["generation"]
+        except (OSError, ValueError, KeyError):
+            pass
+        self._publish(partition)
+
+    def _publish(self, partition):
+        """将分区当前存储写为新的内存映射快照
+
+        Args:
+            partition: 分区名称
+        """
+        store = self.stores[partition]
+        snapshot = store._snapshot
+        codes = snapshot.codes
+        snapshot_dir = get_snapshot_dir(partition, self.snapshot_dir)
+        generation = self.generations.get(partition, 0) + 1
+        self.generations[partition] = generation
+        vectors_name = f"vectors.{generation}.npy"
+        metadata_name = f"metadata.{generation}.pkl"
+        indexes_name = f"indexes.{generation}.pkl"
+
+        if len(store):
+            matrix = np.array(store.vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+
+        np.save(os.path.join(snapshot_dir, vectors_name), matrix)
+        with open(os.path.join(snapshot_dir, metadata_name), "wb") as f:
+            pickle.dump(store.metadata[: len(store)], f)
+        # 规范存储的索引是增量维护的，读者按快照条数截断即可，直接随快照发布
+        with open(os.path.join(snapshot_dir, indexes_name), "wb") as f:
+            pickle.dump((snapshot.metadata_index, snapshot.lexical_index), f)
+
+        # 启用压缩时一并发布编码和编码器参数
+        codes_names, codec_name = [], None
+        if codes is not None and len(store):
+            codec, arrays = codes
+            for i, array in enumerate(arrays):
+                name = f"codes.{generation}.{i}.npy"
+                np.save(os.path.join(snapshot_dir, name), array[: len(store)])
+                codes_names.append(name)
+            codec_name = f"codec.{generation}.pkl"
+            with open(os.path.join(snapshot_dir, codec_name), "wb") as f:
+                pickle.dump(codec, f)
+
+        manifest_path = os.path.join(snapshot_dir, MANIFEST_NAME)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "generation": generation,
+                    "vectors": vectors_name,
+                    "metadata": metadata_name,
+                    "indexes": indexes_name,
+                    "count": len(store),
+                    "codes": codes_names,
+                    "codec": codec_name,
+                    "writer_pid": os.getpid(),
+                },
+                f,
+            )
+        os.replace(tmp_path, manifest_path)
+
+        # 已映射旧快照的 worker 仍持有文件句柄，删除不影响其读取
+        stale = generation - self.keep_generations
+        if stale > 0:
+            for name in os.listdir(snapshot_dir):
+                if name.split(".")[1:2] != [str(stale)]:
+                    continue
+                try:
+                    os.remove(os.path.join(snapshot_dir, name))
+                except FileNotFoundError:
+                    pass
+
+        logger.info(
+            f"已发布向量存储分区 {partition or 'default'} 的快照 #{generation}，"
+            f"共 {len(store)} 个向量"
+        )
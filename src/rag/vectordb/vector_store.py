@@ -1,22 +1,174 @@
 import numpy as np
 import os
 import pickle
+import threading
+import time
+from collections import namedtuple
 from ...config import Config
-from sklearn.metrics.pairwise import cosine_similarity
+from ...utils.text import extract_tables, normalize_question
+from .compression import create_codec
+from .lexical_index import BM25Index
+from .metadata_index import MetadataIndex
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 压缩时每次用矩阵乘法比较的行数
+COMPACT_BLOCK_SIZE = 512
+
+# 发布给读者的不可变快照；codes 为 (编码器, 编码数组元组)，未启用压缩时为None
+_Snapshot = namedtuple(
+    "_Snapshot",
+    ["matrix", "norms", "metadata", "size", "metadata_index", "lexical_index", "codes"],
+)
+
+
+def get_store_path(partition=None):
+    """获取向量存储分区的保存路径
+
+    默认数据库沿用 data/vector_store.pkl，其他数据库各自使用独立文件。
+
+    Args:
+        partition: 分区名称（数据库名称），默认为None
+
+    Returns:
+        str: 保存路径
+    """
+    if not partition or partition == Config.DB_NAME:
+        return "data/vector_store.pkl"
+    return f"data/vector_store_{partition}.pkl"
+
+
 class InMemoryVectorStore:
-    def __init__(self, save_path=None):
+    """内存向量存储
+
+    向量保存在按需倍增的连续矩阵中，每次写入后发布一个不可变的快照
+    （矩阵、向量范数、元数据列表、条数、元数据倒排索引、问题的BM25索引和
+    可选的压缩编码）。追加只写入快照范围之外的行，删除和压缩则生成新的
+    矩阵，因此搜索和保存读取快照时无需加锁，不会被并发写入阻塞，也不会
+    读到写了一半的数据；写操作之间由写锁串行化。
+    """
+
+    def __init__(
+        self,
+        save_path=None,
+        max_size=None,
+        dedup_threshold=None,
+        eviction_policy=None,
+        lexical_weight=None,
+        compression=None,
+    ):
         """初始化内存向量存储
         
         Args:
             save_path: 向量存储保存路径，默认为None，使用配置中的路径
+            max_size: 最大存储条数，默认为配置中的VECTOR_STORE_MAX_SIZE，0表示不限制
+            dedup_threshold: 判定为重复示例的相似度阈值，默认为配置中的
+                VECTOR_STORE_DEDUP_THRESHOLD，0表示只按规范化问题去重
+            eviction_policy: 淘汰策略，"lru" 或 "lfu"，默认为配置中的VECTOR_STORE_EVICTION
+            lexical_weight: 检索时BM25得分的融合权重，默认为配置中的
+                VECTOR_STORE_LEXICAL_WEIGHT，0表示只用向量相似度
+            compression: 搜索时使用的向量压缩方式，"none"、"float16"、"int8"
+                或 "pca"，默认为配置中的VECTOR_STORE_COMPRESSION；压缩编码
+                与原始向量并存，近似打分后用原始向量精确重排
         """
-        self.vectors = []  # 存储向量列表
         self.metadata = []  # 存储元数据列表
-        self.save_path = save_path or "data/vector_store.pkl"
+        self.save_path = save_path or get_store_path()
+        self.max_size = Config.VECTOR_STORE_MAX_SIZE if max_size is None else max_size
+        self.dedup_threshold = (
+            Config.VECTOR_STORE_DEDUP_THRESHOLD
+            if dedup_threshold is None
+            else dedup_threshold
+        )
+        self.eviction_policy = eviction_policy or Config.VECTOR_STORE_EVICTION
+        self.evict_watermark = Config.VECTOR_STORE_EVICT_WATERMARK
+        self.lexical_weight = (
+            Config.VECTOR_STORE_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+        )
+        self.prefilter_min_size = Config.VECTOR_STORE_PREFILTER_MIN_SIZE
+        self.prefilter_candidates = Config.VECTOR_STORE_PREFILTER_CANDIDATES
+        self.compression = compression or Config.VECTOR_STORE_COMPRESSION
+        self.rerank_candidates = Config.VECTOR_STORE_RERANK_CANDIDATES
+        self._codec = create_codec(self.compression, Config.VECTOR_STORE_PCA_DIM)
+        self._codes = None  # 编码数组元组，容量与矩阵相同，前 _size 行有效
+        self._fit_size = 0  # 编码器拟合时的行数
+        self._matrix = None  # 向量矩阵，行数为容量，前 _size 行有效
+        self._norms = None  # 每行向量的范数
+        self._size = 0
+        self._question_index = {}  # 规范化问题 -> 行号
+        self._metadata_index = MetadataIndex()  # 元数据取值 -> 行号
+        self._lexical_index = BM25Index()  # 问题词项 -> 行号
+        self._snapshot = _Snapshot(
+            None, None, self.metadata, 0, self._metadata_index, self._lexical_index, None
+        )
+        self._write_lock = threading.RLock()
+        self._save_lock = threading.Lock()
+
+    @property
+    def vectors(self):
+        """当前全部向量组成的矩阵（只读视图）"""
+        snapshot = self._snapshot
+        if snapshot.matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return snapshot.matrix[: snapshot.size]
+
+    def _publish(self):
+        """发布当前状态的快照，供无锁读取"""
+        self._snapshot = _Snapshot(
+            self._matrix,
+            self._norms,
+            self.metadata,
+            self._size,
+            self._metadata_index,
+            self._lexical_index,
+            (self._codec, self._codes) if self._codes is not None else None,
+        )
+
+    def _ensure_capacity(self, dim):
+        """保证矩阵至少还能追加一行，容量不足时按倍数扩容
+
+        扩容时复制到新矩阵，已发布的快照仍引用旧矩阵，不受影响。
+        """
+        if self._matrix is None:
+            self._matrix = np.empty((16, dim), dtype=np.float32)
+            self._norms = np.empty(16, dtype=np.float32)
+        elif self._size >= len(self._matrix):
+            capacity = len(self._matrix) * 2
+            matrix = np.empty((capacity, self._matrix.shape[1]), dtype=np.float32)
+            norms = np.empty(capacity, dtype=np.float32)
+            matrix[: self._size] = self._matrix[: self._size]
+            norms[: self._size] = self._norms[: self._size]
+            self._matrix, self._norms = matrix, norms
+            if self._codes is not None:
+                codes = self._codec.empty(capacity, self._matrix.shape[1])
+                for new, old in zip(codes, self._codes):
+                    new[: self._size] = old[: self._size]
+                self._codes = codes
+
+    def _fit_codes(self):
+        """拟合编码器并编码全部向量（需持有写锁）
+
+        需要拟合的编码（pca）在行数不足时暂不启用，搜索退回到原始向量；
+        逐条追加时每当行数达到上次拟合时的两倍就重新拟合。
+        """
+        self._codes = None
+        self._fit_size = 0
+        if self._codec is None or self._matrix is None:
+            return
+        if self._size < max(self._codec.min_fit_rows, 1):
+            return
+        vectors = self._normalized(self._matrix[: self._size], self._norms[: self._size])
+        self._codec = self._codec.fit(vectors)
+        self._fit_size = self._size
+        self._codes = self._codec.empty(len(self._matrix), self._matrix.shape[1])
+        for array, encoded in zip(self._codes, self._codec.encode(vectors)):
+            array[: self._size] = encoded
+
+    @staticmethod
+    def _normalized(vectors, norms):
+        """按行归一化"""
+        norms = np.where(norms == 0, 1, norms)
+        return vectors / norms[:, None]
         
     def add_vector(self, vector, metadata):
         """添加向量及其元数据到存储
@@ -28,10 +180,327 @@ class InMemoryVectorStore:
         # 确保向量是一维数组
         if len(vector.shape) > 1:
             vector = vector.flatten()
+
+        if isinstance(metadata, dict):
+            # 预先放入统计字段，之后只更新取值，保存时不会遇到字典大小变化
+            now = time.time()
+            metadata.setdefault("hit_count", 1)
+            metadata.setdefault("created_at", now)
+            metadata.setdefault("last_used", now)
+            self._set_index_fields(metadata)
             
-        self.vectors.append(vector)
-        self.metadata.append(metadata)
-        logger.debug(f"添加向量，当前存储量: {len(self.vectors)}")
+        with self._write_lock:
+            self._ensure_capacity(len(vector))
+            # 写入快照范围之外的行，读者看不到未完成的写入
+            self._matrix[self._size] = vector
+            self._norms[self._size] = np.linalg.norm(vector)
+            if self._codes is not None:
+                encoded = self._codec.encode(
+                    self._normalized(
+                        self._matrix[self._size : self._size + 1],
+                        self._norms[self._size : self._size + 1],
+                    )
+                )
+                for array, value in zip(self._codes, encoded):
+                    array[self._size] = value[0]
+            self.metadata.append(metadata)
+            self._size += 1
+            question = metadata.get("question") if isinstance(metadata, dict) else None
+            if question:
+                self._question_index[normalize_question(question)] = self._size - 1
+            self._metadata_index.add(self._size - 1, metadata)
+            self._lexical_index.add(self._size - 1, metadata)
+            if self._codec is not None:
+                if self._codes is None:
+                    refit = self._size == max(self._codec.min_fit_rows, 1)
+                else:
+                    # 拟合的参数只代表当时的数据，数据量翻倍后重新拟合以免基底漂移
+                    refit = self._codec.min_fit_rows and self._size >= 2 * self._fit_size
+                if refit:
+                    self._fit_codes()
+            self._publish()
+        logger.debug(f"添加向量，当前存储量: {self._size}")
+
+    def upsert(self, vector, metadata):
+        """添加示例，已存在相同或近似的示例时只更新其使用统计
+
+        重复的判定：规范化后的问题相同，或与已有向量的余弦相似度不低于
+        dedup_threshold。问题相同时用新的SQL替换旧SQL；仅语义近似时保留
+        已有示例。新增后超出 max_size 时按淘汰策略移除示例。
+
+        Args:
+            vector: numpy数组，表示文本的嵌入向量
+            metadata: 与向量关联的元数据，需包含 question 字段
+
+        Returns:
+            bool: 是否新增了示例（False 表示更新了已有示例）
+        """
+        if len(vector.shape) > 1:
+            vector = vector.flatten()
+
+        now = time.time()
+        question = normalize_question(metadata.get("question"))
+
+        with self._write_lock:
+            index = self._question_index.get(question)
+            same_question = index is not None
+
+            if index is None and self._size and self.dedup_threshold:
+                similarities = self._similarities(vector)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.dedup_threshold:
+                    index = best
+
+            if index is not None:
+                existing = self.metadata[index]
+                if same_question and "sql" in metadata:
+                    self._replace_sql(index, metadata["sql"])
+                existing["hit_count"] = existing.get("hit_count", 1) + 1
+                existing["last_used"] = now
+                logger.debug(f"示例已存在，更新使用统计: {existing.get('question')}")
+                return False
+
+            self.add_vector(vector, dict(metadata))
+
+            if self.max_size and self._size > self.max_size:
+                self.evict()
+            return True
+
+    def _set_index_fields(self, metadata):
+        """补全用于过滤的元数据字段
+
+        示例存储只保存验证通过的SQL，缺少 success 的旧示例视为成功；
+        缺少 tables 时从SQL中提取引用的表。
+        """
+        metadata.setdefault("success", True)
+        if "tables" not in metadata and metadata.get("sql"):
+            metadata["tables"] = extract_tables(metadata["sql"])
+
+    def record_hits(self, questions, now=None):
+        """记录示例被检索使用（按问题定位），用于淘汰策略
+
+        供无法直接修改元数据的读者（多进程模式下的 worker）转交检索记录。
+
+        Args:
+            questions: 被检索到的示例问题列表
+            now: 使用时间，默认为当前时间
+        """
+        now = now or time.time()
+        with self._write_lock:
+            for question in questions:
+                index = self._question_index.get(normalize_question(question))
+                if index is None:
+                    continue
+                metadata = self.metadata[index]
+                metadata["hit_count"] = metadata.get("hit_count", 1) + 1
+                metadata["last_used"] = now
+
+    def _replace_sql(self, index, sql):
+        """替换已有示例的SQL，并同步更新其引用的表及索引（需持有写锁）"""
+        existing = self.metadata[index]
+        tables = extract_tables(sql)
+        if tables != existing.get("tables"):
+            self._metadata_index.remove(index, {"tables": existing.get("tables")})
+            existing["tables"] = tables
+            self._metadata_index.add(index, {"tables": tables})
+        existing["sql"] = sql
+
+    def _similarities(self, query_vector, snapshot=None, rows=None):
+        """计算查询向量与快照中向量的余弦相似度
+
+        Args:
+            query_vector: 一维查询向量
+            snapshot: 要使用的快照，默认为当前快照
+            rows: 只计算这些行的相似度，默认为全部行
+
+        Returns:
+            numpy数组，每个（选中的）存储向量的相似度
+        """
+        snapshot = snapshot or self._snapshot
+        matrix, norms, size = snapshot.matrix, snapshot.norms, snapshot.size
+        count = size if rows is None else len(rows)
+        query_norm = np.linalg.norm(query_vector)
+        if count == 0 or query_norm == 0:
+            return np.zeros(count, dtype=np.float32)
+        if rows is None:
+            matrix, norms = matrix[:size], norms[:size]
+        else:
+            matrix, norms = matrix[rows], norms[rows]
+        denominators = norms * query_norm
+        denominators[denominators == 0] = 1
+        return (matrix @ query_vector.astype(np.float32)) / denominators
+
+    def _eviction_key(self, metadata):
+        """淘汰排序键，值越小越先被淘汰"""
+        last_used = metadata.get("last_used", metadata.get("created_at", 0))
+        if self.eviction_policy == "lfu":
+            return (metadata.get("hit_count", 1), last_used)
+        return (last_used,)
+
+    def evict(self):
+        """超出 max_size 时按淘汰策略把示例数量减少到 max_size × evict_watermark
+
+        淘汰需要重建全部索引，一次多淘汰一些，使之后的多次新增不再触发淘汰，
+        重建的开销分摊到每条新增上。
+
+        Returns:
+            int: 移除的示例数量
+        """
+        with self._write_lock:
+            if not self.max_size or self._size <= self.max_size:
+                return 0
+            target = min(self.max_size, int(self.max_size * self.evict_watermark))
+            excess = self._size - max(target, 1)
+            if excess <= 0:
+                return 0
+
+            order = sorted(
+                range(self._size),
+                key=lambda i: self._eviction_key(self.metadata[i]),
+            )
+            removed = set(order[:excess])
+            keep = [i for i in range(self._size) if i not in removed]
+            self._replace(self.vectors[keep], [self.metadata[i] for i in keep])
+
+        logger.info(
+            f"向量存储超出容量 {self.max_size}，已淘汰 {excess} 个示例，剩余 {self._size} 个"
+        )
+        return excess
+
+    def compact(self):
+        """合并重复示例并执行容量限制
+
+        按使用次数从高到低保留示例，丢弃与已保留示例问题相同或近似的条目，
+        并把被丢弃条目的使用次数累加到保留的示例上。重复检测在快照上进行，
+        不阻塞写入，只有合并结果时持有写锁。
+
+        Returns:
+            int: 移除的示例数量
+        """
+        snapshot = self._snapshot
+        if snapshot.size == 0:
+            return 0
+        duplicates = self._find_duplicates(snapshot)
+
+        with self._write_lock:
+            if self.metadata is not snapshot.metadata:
+                # 检测期间发生了淘汰或压缩，行号已经变化，本次只执行容量限制
+                duplicates = {}
+            for row, target in duplicates.items():
+                metadata, survivor = self.metadata[row], self.metadata[target]
+                survivor["hit_count"] = survivor.get("hit_count", 1) + metadata.get(
+                    "hit_count", 1
+                )
+                survivor["last_used"] = max(
+                    survivor.get("last_used", 0), metadata.get("last_used", 0)
+                )
+
+            # 保持原有的插入顺序，检测期间新增的行全部保留
+            removed = len(duplicates)
+            if removed:
+                kept = [i for i in range(self._size) if i not in duplicates]
+                self._replace(self.vectors[kept], [self.metadata[i] for i in kept])
+            removed += self.evict()
+
+        if removed:
+            logger.info(f"向量存储压缩完成，移除 {removed} 个示例，剩余 {self._size} 个")
+        return removed
+
+    def _find_duplicates(self, snapshot):
+        """找出快照中的重复示例（无需持有写锁）
+
+        按淘汰策略从高到低依次保留示例，问题相同或与已保留示例的余弦相似度
+        不低于 dedup_threshold 的示例视为重复。相似度按块用矩阵乘法计算，
+        每块只与排在它之前的行比较。
+
+        Args:
+            snapshot: 要检测的快照
+
+        Returns:
+            dict: 重复示例的行号 -> 保留的示例行号
+        """
+        total = snapshot.size
+        metadata = snapshot.metadata[:total]
+        order = sorted(
+            range(total),
+            key=lambda i: self._eviction_key(metadata[i]),
+            reverse=True,
+        )
+        matrix = None
+        if self.dedup_threshold:
+            # 按保留顺序排列的归一化矩阵，下文的位置均指在 order 中的位置
+            matrix = self._normalized(snapshot.matrix[:total], snapshot.norms[:total])[
+                order
+            ]
+
+        duplicates = {}
+        kept = np.zeros(total, dtype=bool)
+        kept_questions = {}
+        for start in range(0, total, COMPACT_BLOCK_SIZE):
+            end = min(start + COMPACT_BLOCK_SIZE, total)
+            if matrix is not None:
+                similarities = matrix[start:end] @ matrix[:end].T
+                rows, columns = np.nonzero(similarities >= self.dedup_threshold)
+                bounds = np.searchsorted(rows, np.arange(end - start + 1))
+
+            for position in range(start, end):
+                i = order[position]
+                question = normalize_question(metadata[i].get("question"))
+                target = kept_questions.get(question)
+
+                if target is None and matrix is not None:
+                    offset = position - start
+                    candidates = columns[bounds[offset] : bounds[offset + 1]]
+                    candidates = candidates[candidates < position]
+                    candidates = candidates[kept[candidates]]
+                    if len(candidates):
+                        best = candidates[np.argmax(similarities[offset, candidates])]
+                        target = order[best]
+
+                if target is None:
+                    kept[position] = True
+                    kept_questions[question] = i
+                else:
+                    duplicates[i] = target
+        return duplicates
+
+    def _replace(self, vectors, metadata):
+        """用新的矩阵替换全部向量和元数据，重建问题索引并发布快照
+
+        Args:
+            vectors: 向量矩阵或向量列表
+            metadata: 元数据列表
+        """
+        metadata = list(metadata)
+        now = time.time()
+        for item in metadata:
+            # 兼容旧版本保存的元数据
+            if isinstance(item, dict):
+                item.setdefault("hit_count", 1)
+                item.setdefault("created_at", now)
+                item.setdefault("last_used", item["created_at"])
+                self._set_index_fields(item)
+        if len(metadata) == 0:
+            self._matrix = None
+            self._norms = None
+        else:
+            self._matrix = np.array(vectors, dtype=np.float32)
+            self._norms = np.linalg.norm(self._matrix, axis=1).astype(np.float32)
+        self.metadata = metadata
+        self._size = len(metadata)
+        self._rebuild_index()
+        self._fit_codes()
+        self._publish()
+
+    def _rebuild_index(self):
+        """重建规范化问题到行号的索引、元数据倒排索引和BM25索引"""
+        self._question_index = {
+            normalize_question(metadata.get("question")): i
+            for i, metadata in enumerate(self.metadata)
+            if isinstance(metadata, dict) and metadata.get("question")
+        }
+        self._metadata_index = MetadataIndex.build(self.metadata)
+        self._lexical_index = BM25Index.build(self.metadata)
         
     def add_vectors(self, vectors, metadata_list):
         """批量添加向量及其元数据
@@ -44,52 +513,243 @@ class InMemoryVectorStore:
         
         for vector, metadata in zip(vectors, metadata_list):
             self.add_vector(vector, metadata)
+
+    def upsert_many(self, vectors, metadata_list):
+        """批量导入示例
+
+        只按规范化问题去重（语义近似的重复留给 compact 处理），避免逐条
+        计算与全部已有向量的相似度；全部导入后再执行一次容量限制。
+
+        Args:
+            vectors: 向量列表
+            metadata_list: 元数据列表，每项需包含 question 字段
+
+        Returns:
+            int: 新增的示例数量
+        """
+        assert len(vectors) == len(metadata_list), "向量和元数据数量必须一致"
+
+        added = 0
+        with self._write_lock:
+            for vector, metadata in zip(vectors, metadata_list):
+                index = self._question_index.get(
+                    normalize_question(metadata.get("question"))
+                )
+                if index is not None:
+                    if "sql" in metadata:
+                        self._replace_sql(index, metadata["sql"])
+                    continue
+
+                self.add_vector(vector, dict(metadata))
+                added += 1
+
+            if self.max_size and self._size > self.max_size:
+                self.evict()
+
+        return added
             
-    def search(self, query_vector, top_k=5):
+    def search(self, query_vector, top_k=5, filters=None, query_text=None):
         """搜索与查询向量最相似的向量
+
+        读取当前快照计算相似度，不获取写锁。给出 filters 时先通过元数据
+        倒排索引得到匹配的行，只对这些行计算相似度。给出 query_text 时
+        按 lexical_weight 融合问题的BM25得分，存储较大时还会先用BM25
+        选出候选行（见 _candidate_rows）。
         
         Args:
             query_vector: 查询向量
             top_k: 返回的最相似向量数量
+            filters: 元数据过滤条件，字段 -> 取值或取值列表，例如
+                {"tables": ["orders", "users"], "success": True}；
+                可用字段见 metadata_index.INDEXED_FIELDS
+            query_text: 查询问题原文，用于词法检索
             
         Returns:
-            列表，包含元组(相似度, 元数据)，按相似度降序排序
+            列表，包含元组(得分, 元数据)，按得分降序排序；未融合词法得分时
+            得分即余弦相似度
         """
-        if not self.vectors:
+        snapshot = self._snapshot
+        metadata_list, size = snapshot.metadata, snapshot.size
+        if size == 0:
             logger.warning("向量存储为空，无法执行搜索")
             return []
+
+        rows, lexical = self._candidate_rows(
+            snapshot.metadata_index,
+            snapshot.lexical_index,
+            size,
+            top_k,
+            filters,
+            query_text,
+        )
+        if rows is not None and len(rows) == 0:
+            logger.info(f"没有满足过滤条件的示例: {filters}")
+            return []
             
         # 确保查询向量是一维数组
         if len(query_vector.shape) > 1:
             query_vector = query_vector.flatten()
+
+        # 启用压缩时先用编码近似打分，只保留得分最高的候选
+        rows = self._rerank_rows(snapshot.codes, query_vector, size, top_k, rows, lexical)
             
-        # 向量化计算相似度，性能更好
-        vectors_array = np.array(self.vectors)
-        query_vector = query_vector.reshape(1, -1)
-        
-        # 使用sklearn的余弦相似度计算，支持批量计算
-        similarities = cosine_similarity(query_vector, vectors_array)[0]
+        # 向量化计算余弦相似度，并融合词法得分
+        similarities = self._similarities(query_vector, snapshot, rows)
+        scores = self._fuse_scores(similarities, rows, lexical)
         
-        # 获取top_k个最相似的索引
-        top_indices = np.argsort(similarities)[-top_k:][::-1]
+        # 获取top_k个得分最高的索引
+        top_k = min(top_k, len(scores))
+        top_indices = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
         
-        # 构建结果列表
-        results = [(similarities[i], self.metadata[i]) for i in top_indices]
+        # 构建结果列表，并记录示例被检索使用
+        now = time.time()
+        results = []
+        for i in top_indices:
+            metadata = metadata_list[i if rows is None else rows[i]]
+            if isinstance(metadata, dict):
+                metadata["hit_count"] = metadata.get("hit_count", 1) + 1
+                metadata["last_used"] = now
+            results.append((scores[i], metadata))
         
         return results
+
+    def _candidate_rows(
+        self, metadata_index, lexical_index, size, top_k, filters=None, query_text=None
+    ):
+        """确定需要计算向量相似度的行，并计算词法得分
+
+        候选行先由元数据过滤条件确定；候选数不少于 prefilter_min_size 时，
+        再只保留BM25得分最高的 prefilter_candidates 行。与问题没有任何词项
+        重合的行不足 top_k 时不做预筛选，避免漏掉只在语义上相近的示例。
+
+        Args:
+            metadata_index: 快照中的元数据倒排索引
+            lexical_index: 快照中的BM25索引
+            size: 快照条数
+            top_k: 需要返回的结果数
+            filters: 元数据过滤条件
+            query_text: 查询问题原文
+
+        Returns:
+            Tuple: (候选行号数组或None表示全部行, (行号, BM25得分)或None)
+        """
+        rows = None
+        if filters:
+            rows = metadata_index.candidates(filters, size)
+            if len(rows) == 0:
+                return rows, None
+
+        lexical = None
+        prefilter = self.prefilter_min_size and (
+            size if rows is None else len(rows)
+        ) >= self.prefilter_min_size
+        if query_text and (self.lexical_weight or prefilter):
+            lexical_rows, lexical_scores = lexical_index.scores(query_text, size)
+            if rows is not None:
+                mask = np.isin(lexical_rows, rows, assume_unique=True)
+                lexical_rows, lexical_scores = lexical_rows[mask], lexical_scores[mask]
+            lexical = (lexical_rows, lexical_scores)
+
+            if prefilter and len(lexical_rows) >= top_k:
+                if len(lexical_rows) > self.prefilter_candidates:
+                    keep = np.argpartition(
+                        -lexical_scores, self.prefilter_candidates - 1
+                    )[: self.prefilter_candidates]
+                    keep.sort()
+                    lexical = (lexical_rows[keep], lexical_scores[keep])
+                rows = lexical[0]
+
+        if rows is not None and len(rows) == size:
+            rows = None
+        return rows, lexical
+
+    def _rerank_rows(self, codes, query_vector, size, top_k, rows=None, lexical=None):
+        """用压缩编码近似打分，选出需要用原始向量精确重排的行
+
+        Args:
+            codes: 快照中的 (编码器, 编码数组元组)，None表示未启用压缩
+            query_vector: 一维查询向量
+            size: 快照条数
+            top_k: 需要返回的结果数
+            rows: 候选行号（升序），None表示全部行
+            lexical: (行号, BM25得分)，参与近似得分的融合
+
+        Returns:
+            numpy数组或None: 精确重排的候选行号（升序）；不需要近似打分时原样返回 rows
+        """
+        limit = max(self.rerank_candidates, top_k)
+        count = size if rows is None else len(rows)
+        if codes is None or not self.rerank_candidates or count <= limit:
+            return rows
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return rows
+
+        codec, arrays = codes
+        query = (query_vector / norm).astype(np.float32)
+        approximate = self._fuse_scores(
+            codec.scores(arrays, query, size, rows), rows, lexical
+        )
+        keep = np.argpartition(-approximate, limit - 1)[:limit]
+        keep.sort()
+        return keep if rows is None else rows[keep]
+
+    def _fuse_scores(self, similarities, rows, lexical):
+        """按 lexical_weight 融合向量相似度和归一化到 [0, 1] 的BM25得分
+
+        Args:
+            similarities: 候选行的余弦相似度
+            rows: 候选行号（升序），None表示全部行
+            lexical: (行号, BM25得分)，None表示没有词法得分
+
+        Returns:
+            numpy数组，候选行的融合得分
+        """
+        if lexical is None or not self.lexical_weight or len(lexical[0]) == 0:
+            return similarities
+        lexical_rows, lexical_scores = lexical
+        if rows is None:
+            positions = lexical_rows
+        else:
+            positions = np.searchsorted(rows, lexical_rows)
+            positions = np.minimum(positions, len(rows) - 1)
+            matched = rows[positions] == lexical_rows
+            positions, lexical_scores = positions[matched], lexical_scores[matched]
+
+        lexical_dense = np.zeros(len(similarities), dtype=np.float32)
+        if len(positions):
+            lexical_dense[positions] = lexical_scores / lexical_scores.max()
+        weight = self.lexical_weight
+        return (1 - weight) * similarities + weight * lexical_dense
     
     def clear(self):
         """清空向量存储"""
-        self.vectors = []
-        self.metadata = []
+        with self._write_lock:
+            self._replace([], [])
         logger.info("向量存储已清空")
         
     def save(self):
-        """保存向量存储到文件"""
+        """保存向量存储到文件
+
+        序列化的是当前快照，不阻塞并发写入；先写临时文件再替换，
+        避免进程中断时留下不完整的文件。
+        """
+        snapshot = self._snapshot
+        metadata, size = snapshot.metadata, snapshot.size
+        vectors = (
+            snapshot.matrix[:size]
+            if snapshot.matrix is not None
+            else np.empty((0, 0), np.float32)
+        )
+
         os.makedirs(os.path.dirname(self.save_path), exist_ok=True)
-        with open(self.save_path, "wb") as f:
-            pickle.dump({"vectors": self.vectors, "metadata": self.metadata}, f)
-        logger.info(f"向量存储已保存到 {self.save_path}，共 {len(self.vectors)} 个向量")
+        with self._save_lock:
+            tmp_path = f"{self.save_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"vectors": vectors, "metadata": metadata[:size]}, f)
+            os.replace(tmp_path, self.save_path)
+        logger.info(f"向量存储已保存到 {self.save_path}，共 {size} 个向量")
             
     def load(self):
         """从文件加载向量存储"""
@@ -97,9 +757,9 @@ class InMemoryVectorStore:
             try:
                 with open(self.save_path, "rb") as f:
                     data = pickle.load(f)
-                    self.vectors = data["vectors"]
-                    self.metadata = data["metadata"]
-                logger.info(f"从 {self.save_path} 加载了 {len(self.vectors)} 个向量")
+                    with self._write_lock:
+                        self._replace(data["vectors"], data["metadata"])
+                logger.info(f"从 {self.save_path} 加载了 {self._size} 个向量")
                 return True
             except Exception as e:
                 logger.error(f"加载向量存储失败: {str(e)}")
@@ -110,4 +770,4 @@ class InMemoryVectorStore:
             
     def __len__(self):
         """返回存储的向量数量"""
-        return len(self.vectors)
\ No newline at end of file
+        return self._snapshot.size
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import queue
+import threading
+import time
+from ...config import Config
+from ...utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """示例存储的后台批量写入器
+
+    请求线程只把新示例放入队列即返回；后台线程在积累到 batch_size 条或
+    距上次写入超过 flush_interval 秒时，把示例批量写入各自的向量存储，
+    每个存储只保存一次。关闭时会写入队列中剩余的全部示例。
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_queue=None):
+        """初始化后台写入器
+
+        Args:
+            batch_size: 触发写入的示例数，默认为配置中的WRITE_BEHIND_BATCH_SIZE
+            flush_interval: 最长写入间隔秒数，默认为配置中的WRITE_BEHIND_FLUSH_INTERVAL
+            max_queue: 队列容量，默认为配置中的WRITE_BEHIND_MAX_QUEUE，队列满时丢弃新示例
+        """
+        self.batch_size = batch_size or Config.WRITE_BEHIND_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.WRITE_BEHIND_FLUSH_INTERVAL
+        self.queue = queue.Queue(maxsize=max_queue or Config.WRITE_BEHIND_MAX_QUEUE)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        """按需启动后台线程（线程不会跨 fork 继承，每个进程各自启动）"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, store, vector, metadata):
+        """提交一个待写入的示例，不阻塞调用方
+
+        Args:
+            store: 目标向量存储
+            vector: numpy数组，表示文本的嵌入向量
+            metadata: 与向量关联的元数据
+
+        Returns:
+            bool: 是否成功放入队列（队列已满时丢弃并返回False）
+        """
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((store, vector, metadata))
+        except queue.Full:
+            metrics.increment("write_behind.dropped")
+            logger.warning("示例写入队列已满，丢弃新示例")
+            return False
+        metrics.set_gauge("write_behind.queue_depth", self.queue.qsize())
+        return True
+
+    def stop(self, timeout=10):
+        """写入队列中剩余的示例并停止后台线程
+
+        Args:
+            timeout: 等待后台线程结束的秒数
+        """
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("示例写入线程未能按时结束")
+        self._thread = None
+
+    def _run(self):
+        """后台线程主循环"""
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    running = False
+                    # 取出停止标记前已入队的全部示例
+                    while True:
+                        try:
+                            item = self.queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not _STOP:
+                            batch.append(item)
+                    break
+                batch.append(item)
+
+            metrics.set_gauge("write_behind.queue_depth", self.queue.qsize())
+            if batch:
+                self._flush(batch)
+
+        logger.info("示例写入线程已结束")
+
+    def _flush(self, batch):
+        """把一批示例写入各自的存储并保存
+
+        Args:
+            batch: (store, vector, metadata) 列表
+        """
+        started = time.perf_counter()
+
+        stores = {}
+        for store, vector, metadata in batch:
+            try:
+                store.upsert(vector, metadata)
+                stores[id(store)] = store
+            except Exception as e:
+                metrics.increment("write_behind.errors")
+                logger.error(f"写入示例失败: {str(e)}")
+
+        for store in stores.values():
+            try:
+                store.save()
+            except Exception as e:
+                metrics.increment("write_behind.errors")
+                logger.error(f"保存向量存储失败: {str(e)}")
+
+        elapsed = time.perf_counter() - started
+        metrics.increment("write_behind.flushed", len(batch))
+        metrics.observe("write_behind.flush_seconds", elapsed)
+        logger.info(f"已写入 {len(batch)} 个示例，耗时 {elapsed * 1000:.1f}ms")
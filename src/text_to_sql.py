@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
-from .database.schema_manager import SchemaManager
-from .database.sql_validator import SQLValidator
+from .config import Config
+from .database.registry import DatabaseRegistry, UnknownDatabase
+from .database.sql_validator import EXECUTED, SYNTAX_ONLY
 from .rag.embedding.bert_embedding_model import BertEmbedding
-from .rag.vectordb.vector_store import InMemoryVectorStore
+from .llm.admission import INTERACTIVE, AdmissionRejected
 from .llm.deepseek import Deepseek
+from .rag.template_sql import synthesize_sql
+from .rag.vectordb.write_behind import WriteBehindWriter
+from .utils.cancellation import CancellationToken, RequestCancelled
+from .utils.metrics import metrics
+from .utils.request_log import RequestLog, current_request_log, request_log
+from .utils.single_flight import SingleFlight
+from .utils.text import extract_tables, normalize_question
+import contextvars
 import logging
-from typing import Dict, List, Optional, Any
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Dict, List, Optional, Any, Callable
 
 logger = logging.getLogger(__name__)
 
@@ -19,21 +31,47 @@ class Text2SQL:
     - 向量存储和相似查询
     - 使用LLM生成SQL
     - SQL验证
+    - 多数据库支持（每个数据库独立的Schema缓存、连接池和示例存储）
     """
 
-    def __init__(self):
-        """初始化Text2SQL系统的各个组件"""
-        self.schema_manager = SchemaManager()
+    def __init__(self, vector_store_factory: Optional[Callable] = None):
+        """初始化Text2SQL系统的各个组件
+
+        Args:
+            vector_store_factory: 按数据库名称创建示例向量存储的函数，
+                默认为None，使用进程内的InMemoryVectorStore
+        """
         self.bert_embedding_model = BertEmbedding()
-        self.vectore_store = InMemoryVectorStore()
         self.deepseek = Deepseek()
-        self.sql_validator = SQLValidator()
+        self.registry = DatabaseRegistry(vector_store_factory=vector_store_factory)
+        self.single_flight = SingleFlight("generate_sql")
+        self.write_behind = WriteBehindWriter()
+        self.template_synthesis = Config.TEMPLATE_SYNTHESIS
+        self.candidate_count = max(1, Config.LLM_CANDIDATES)
+        self.candidate_budget = Config.LLM_CANDIDATE_BUDGET
 
-    def generate_sql(self, prompt: str) -> Dict[str, Any]:
+    def generate_sql(
+        self,
+        prompt: str,
+        database: Optional[str] = None,
+        tables: Optional[List[str]] = None,
+        priority: int = INTERACTIVE,
+        cancel: Optional[CancellationToken] = None,
+    ) -> Dict[str, Any]:
         """生成SQL查询语句
 
+        同一数据库、同一Schema版本下规范化后相同的并发问题只执行一次
+        生成流程，其余请求等待并共享其结果。执行者被取消时，仍在等待的
+        其他请求重新执行。
+
         Args:
             prompt (str): 用户的自然语言查询
+            database (Optional[str]): 目标数据库名称，默认为None，使用默认数据库
+            tables (Optional[List[str]]): 问题涉及的表，给出时只检索引用了
+                其中任一张表的相似示例
+            priority (int): LLM调用的准入优先级，INTERACTIVE 或 BATCH
+            cancel (Optional[CancellationToken]): 请求的取消标记，取消后中止
+                LLM调用和数据库查询，且不保存示例
 
         Returns:
             Dict[str, Any]: 包含以下字段的结果字典：
@@ -42,75 +80,314 @@ class Text2SQL:
                 - error (Optional[str]): 错误信息（如果有）
                 - columns (List[str]): 查询结果的列名
                 - similar_examples (List[Dict]): 相似的查询示例
+                - prompt_tokens (Optional[int]): 发送给LLM的提示token数
+                - cache_hit_tokens (Optional[int]): 提示中命中API上下文缓存的token数
+                - validation (str): 验证方式，"executed" 表示已在数据库上执行，
+                  "syntax_only" 表示数据库不可用时仅验证了语法
+                - generation (str): SQL来源，"template" 表示由相似示例的模板生成，
+                  "llm" 表示由LLM生成
+
+        Raises:
+            AdmissionRejected: LLM调用未被准入，由调用方返回 429/503
+            RequestCancelled: 请求被取消或超过截止时间
+            UnknownDatabase: 数据库不在允许列表中，由调用方返回 404
         """
-        try:
-            # 提取表结构
-            logger.info("开始提取数据库结构")
-            schema_info = self.schema_manager.extract_schema()
-            format_schema_for_prompt = self.schema_manager.format_schema_for_prompt(
-                schema_info
-            )
-            logger.info("数据库结构提取完成")
+        with request_log("generate_sql", logger) as log:
+            try:
+                context = self.registry.get(database)
+
+                log.set(database=context.db_name, priority=priority)
+                log.payload(question=prompt)
+
+                # 提取表结构
+                # 提示文本与版本取自同一个快照，后台刷新不会使两者不一致
+                with log.stage("schema"):
+                    schema = context.schema_manager.get_schema_snapshot()
+                format_schema_for_prompt = schema.prompt
+
+                key = (
+                    context.db_name,
+                    schema.version,
+                    normalize_question(prompt),
+                    tuple(sorted(table.lower() for table in tables or ())),
+                )
+                while True:
+                    try:
+                        result, shared = self.single_flight.do(
+                            key,
+                            self._generate_sql,
+                            prompt,
+                            context,
+                            format_schema_for_prompt,
+                            tables,
+                            priority,
+                            cancel,
+                            cancel=cancel,
+                        )
+                        break
+                    except RequestCancelled:
+                        # 被取消的是共享执行的其他请求时重新执行
+                        if cancel is None or cancel.cancelled:
+                            raise
+                        cancel.check()
+                        logger.info("合并的查询已被取消，重新执行")
+                log.set(
+                    shared=shared,
+                    success=result.get("success"),
+                    generation=result.get("generation"),
+                    validation=result.get("validation"),
+                    prompt_tokens=result.get("prompt_tokens"),
+                    cache_hit_tokens=result.get("cache_hit_tokens"),
+                )
+                log.payload(sql=result.get("sql"))
+                return dict(result)
+
+            except (AdmissionRejected, RequestCancelled, UnknownDatabase):
+                raise
+            except Exception as e:
+                logger.error(f"SQL生成过程出错: {str(e)}", exc_info=True)
+                log.set(success=False, error=str(e))
+                return {
+                    "success": False,
+                    "sql": "",
+                    "error": f"SQL生成过程出错: {str(e)}",
+                    "columns": [],
+                    "similar_examples": [],
+                }
+
+    def _generate_sql(
+        self,
+        prompt: str,
+        context,
+        format_schema_for_prompt: str,
+        tables: Optional[List[str]] = None,
+        priority: int = INTERACTIVE,
+        cancel: Optional[CancellationToken] = None,
+    ) -> Dict[str, Any]:
+        """执行一次完整的SQL生成流程
+
+        每个阶段开始前检查取消标记，被取消的请求不再调用LLM、执行SQL或保存示例。
 
-            # 将prompt转换为嵌入向量
-            logger.info(f"开始处理用户查询: {prompt}")
+        Args:
+            prompt (str): 用户的自然语言查询
+            context: 目标数据库上下文
+            format_schema_for_prompt (str): 用于提示的Schema文本
+            tables (Optional[List[str]]): 用于过滤相似示例的表
+            priority (int): LLM调用的准入优先级
+            cancel (Optional[CancellationToken]): 请求的取消标记
+
+        Returns:
+            Dict[str, Any]: 结果字典，字段同 generate_sql
+
+        Raises:
+            RequestCancelled: 请求被取消或超过截止时间
+        """
+        if cancel is None:
+            cancel = CancellationToken()
+
+        log = current_request_log() or RequestLog("generate_sql")
+
+        # 将prompt转换为嵌入向量
+        with log.stage("embedding"):
             prompt_to_vector = self.bert_embedding_model.get_embedding(prompt)
-            logger.info("向量嵌入完成")
-
-            # 从向量存储库中搜索相似问题
-            logger.info("开始搜索相似查询")
-            similar_example = self.vectore_store.search(prompt_to_vector)
-            examples = [metadata for _, metadata in similar_example]
-            logger.info(f"找到 {len(examples)} 个相似查询")
-
-            # 使用LLM生成SQL语句
-            logger.info("开始生成SQL语句")
-            sql = self.deepseek.get_response(prompt, format_schema_for_prompt)
-            logger.info(f"生成的SQL: {sql}")
-
-            # 验证生成的SQL
-            logger.info("开始验证SQL")
-            is_sql_safe, error_message, columns = self.sql_validator.test_execute(sql)
-
-            # 处理磁盘空间不足的情况
-            if not is_sql_safe and any(
-                error in error_message.lower()
-                for error in ["space left on device", "disk full"]
-            ):
-                logger.warning("服务器磁盘空间不足，尝试仅进行语法验证")
-                is_sql_safe, syntax_error = self.sql_validator.validate_syntax(sql)
-                if is_sql_safe:
-                    columns = []
-                    error_message = "SQL语法正确，但服务器磁盘空间不足，无法执行"
-                    logger.info("SQL语法验证通过")
+
+        cancel.check()
+
+        # 从向量存储库中搜索相似问题
+        with log.stage("search"):
+            filters = {"tables": tables} if tables else None
+            similar_example = context.vector_store.search(
+                prompt_to_vector, filters=filters, query_text=prompt
+            )
+        examples = [metadata for _, metadata in similar_example]
+        log.set(similar_examples=len(examples))
+
+        # 与相似示例同形的问题直接由示例模板生成SQL，执行验证通过时不再调用LLM
+        sql, generation, llm_stats = None, "llm", {}
+        if self.template_synthesis:
+            synthesized = synthesize_sql(prompt, examples)
+            if synthesized is not None:
+                candidate, _ = synthesized
+                with log.stage("template_validate"):
+                    is_sql_safe, error_message, columns, validation = (
+                        context.sql_validator.validate(candidate, cancel)
+                    )
+                if is_sql_safe and validation == EXECUTED:
+                    sql, generation = candidate, "template"
+                    metrics.increment("template_sql.hit")
                 else:
-                    error_message = syntax_error
-                    logger.warning(f"SQL语法验证失败: {syntax_error}")
-
-            # 处理验证结果
-            if is_sql_safe:
-                logger.info("SQL验证通过，保存到向量存储")
-                metadata = {"question": prompt, "sql": sql}
-                self.vectore_store.add_vector(prompt_to_vector, metadata)
-                self.vectore_store.save()
+                    metrics.increment("template_sql.rejected")
+                    log.payload(template_sql=candidate, template_error=error_message)
+
+        if sql is None:
+            # 使用LLM生成SQL语句并验证，配置了多个候选时并行生成
+            if self.candidate_count > 1:
+                candidate = self._generate_candidates(
+                    prompt, context, format_schema_for_prompt, examples, priority, cancel
+                )
             else:
-                logger.warning(f"SQL验证失败: {error_message}")
+                candidate = self._generate_candidate(
+                    prompt, context, format_schema_for_prompt, examples, priority, cancel
+                )
+            sql, is_sql_safe, error_message, columns, validation, llm_stats = candidate
+
+        # 客户端已放弃的请求不保存示例
+        cancel.check()
 
-            # 返回结果
-            return {
-                "success": is_sql_safe,
+        # 处理验证结果（仅通过语法验证的SQL不保存为示例）
+        if is_sql_safe and validation == EXECUTED:
+            metadata = {
+                "question": prompt,
                 "sql": sql,
-                "error": error_message if not is_sql_safe else None,
-                "columns": columns if is_sql_safe else [],
-                "similar_examples": examples[:3],  # 仅返回前3个示例
+                "database": context.db_name,
+                "tables": extract_tables(sql),
+                "success": True,
             }
+            self.write_behind.submit(context.vector_store, prompt_to_vector, metadata)
+        elif not is_sql_safe:
+            log.set(error=error_message)
 
-        except Exception as e:
-            logger.error(f"SQL生成过程出错: {str(e)}", exc_info=True)
-            return {
-                "success": False,
-                "sql": "",
-                "error": f"SQL生成过程出错: {str(e)}",
-                "columns": [],
-                "similar_examples": [],
-            }
+        # 返回结果
+        return {
+            "success": is_sql_safe,
+            "sql": sql,
+            "error": error_message if not is_sql_safe else None,
+            "columns": columns if is_sql_safe else [],
+            # 仅返回前3个示例的问题和SQL，不暴露存储内部的统计字段
+            "similar_examples": [
+                {"question": example.get("question"), "sql": example.get("sql")}
+                for example in examples[:3]
+            ],
+            "prompt_tokens": llm_stats.get("prompt_tokens"),
+            "cache_hit_tokens": llm_stats.get("cache_hit_tokens"),
+            "validation": validation,
+            "generation": generation,
+        }
+
+    def _generate_candidate(
+        self,
+        prompt: str,
+        context,
+        format_schema_for_prompt: str,
+        examples: List[Dict],
+        priority: int,
+        cancel,
+    ):
+        """调用一次LLM生成SQL并验证
+
+        Args:
+            prompt (str): 用户的自然语言查询
+            context: 目标数据库上下文
+            format_schema_for_prompt (str): 用于提示的Schema文本
+            examples (List[Dict]): 检索到的相似示例，用作提示中的示例
+            priority (int): LLM调用的准入优先级
+            cancel (CancellationToken): 取消标记，已取消时不再验证
+
+        Returns:
+            Tuple: (sql, 是否有效, 错误信息, 列名, 验证方式, LLM统计)
+
+        Raises:
+            RequestCancelled: 请求被取消或超过截止时间
+        """
+        log = current_request_log() or RequestLog("generate_sql")
+        llm_stats = {}
+        with log.stage("llm"):
+            sql = self.deepseek.get_response(
+                prompt,
+                format_schema_for_prompt,
+                stats=llm_stats,
+                priority=priority,
+                cancel=cancel,
+                examples=examples,
+            )
+        cancel.check()
+
+        # 验证生成的SQL（数据库不可用或磁盘空间不足时仅验证语法）
+        with log.stage("validate"):
+            is_sql_safe, error_message, columns, validation = (
+                context.sql_validator.validate(sql, cancel)
+            )
+        if is_sql_safe and validation == SYNTAX_ONLY:
+            logger.warning(f"SQL仅通过语法验证: {error_message}")
+        return sql, is_sql_safe, error_message, columns, validation, llm_stats
+
+    def _generate_candidates(
+        self,
+        prompt: str,
+        context,
+        format_schema_for_prompt: str,
+        examples: List[Dict],
+        priority: int,
+        cancel,
+    ):
+        """并行生成多个候选SQL，返回最先通过验证的一个
+
+        每个候选在各自的线程中调用LLM并立即验证（通过连接池并行执行），
+        第一个有效候选返回后取消其余候选：进行中的LLM调用和查询被中止，
+        尚未开始的调用不再执行。超出 candidate_budget 秒仍没有有效候选时
+        返回已完成的第一个失败结果。
+
+        Returns:
+            Tuple: 同 _generate_candidate
+
+        Raises:
+            RequestCancelled: 请求被取消或超过截止时间
+        """
+        log = current_request_log() or RequestLog("generate_sql")
+        candidates = CancellationToken(self.candidate_budget, parent=cancel)
+        executor = ThreadPoolExecutor(
+            max_workers=self.candidate_count, thread_name_prefix="sql-candidate"
+        )
+        # 候选线程沿用当前请求的上下文（请求ID和结构化日志）
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                self._generate_candidate,
+                prompt,
+                context,
+                format_schema_for_prompt,
+                examples,
+                priority,
+                candidates,
+            )
+            for _ in range(self.candidate_count)
+        ]
+        metrics.increment("llm.candidates.requested", len(futures))
+
+        started = time.monotonic()
+        failed, errors, completed = None, [], 0
+        try:
+            for future in as_completed(futures, timeout=candidates.remaining()):
+                completed += 1
+                try:
+                    candidate = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if candidate[1]:
+                    metrics.observe(
+                        "llm.candidates.winner_seconds", time.monotonic() - started
+                    )
+                    metrics.increment(
+                        "llm.candidates.wasted", len(futures) - completed
+                    )
+                    log.set(candidate_winner=completed)
+                    return candidate
+                failed = failed or candidate
+        except FuturesTimeoutError:
+            pass
+        finally:
+            candidates.cancel("候选SQL生成结束")
+            candidates.release()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        cancel.check()
+        if failed is not None:
+            return failed
+        # 超出时间预算而中止的候选不视为错误
+        errors = [e for e in errors if not isinstance(e, RequestCancelled)]
+        if errors:
+            raise errors[0]
+        metrics.increment("llm.candidates.timed_out")
+        logger.warning(f"{self.candidate_budget} 秒内没有通过验证的候选SQL")
+        return "", False, "候选SQL生成超时", [], EXECUTED, {}
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCancelled(Exception):
+    """请求已被取消（客户端断开连接或超过截止时间）
+
+    Attributes:
+        timed_out: 是否因超过截止时间而取消
+    """
+
+    def __init__(self, message, timed_out=False):
+        super().__init__(message)
+        self.timed_out = timed_out
+
+
+class CancellationToken:
+    """请求级的取消标记
+
+    由接收请求的一方创建并在客户端断开或超时时调用 cancel()；执行各阶段
+    的一方在阶段之间调用 check()，并可通过 add_callback 注册中止正在
+    进行的阻塞操作（关闭LLM流式响应、终止数据库查询）的回调。
+    """
+
+    def __init__(self, timeout=None, parent=None):
+        """初始化
+
+        Args:
+            timeout: 距截止时间的秒数，默认为None，没有截止时间
+            parent: 父标记（可选），父标记取消时本标记随之取消
+        """
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_id = 0
+        self._reason = None
+        self._timed_out = False
+        self._remove_from_parent = None
+        if parent is not None:
+            if parent.deadline is not None and (
+                self.deadline is None or parent.deadline < self.deadline
+            ):
+                self.deadline = parent.deadline
+            self._remove_from_parent = parent.add_callback(
+                lambda: self.cancel(parent._reason, parent._timed_out)
+            )
+
+    @property
+    def expired(self):
+        """是否已超过截止时间"""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def cancelled(self):
+        """是否已被取消或超过截止时间"""
+        return self._reason is not None or self.expired
+
+    def remaining(self):
+        """距截止时间的秒数，没有截止时间时为None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason="请求已取消", timed_out=False):
+        """取消请求并执行已注册的回调，重复调用无效
+
+        Args:
+            reason: 取消原因
+            timed_out: 是否因超过截止时间而取消
+        """
+        with self._lock:
+            if self._reason is not None:
+                return
+            self._reason = reason
+            self._timed_out = timed_out
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+
+        logger.info(f"请求已取消: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"执行取消回调失败: {str(e)}")
+
+    def check(self):
+        """已取消时抛出 RequestCancelled
+
+        Raises:
+            RequestCancelled: 请求已被取消或超过截止时间
+        """
+        if self._reason is not None:
+            raise RequestCancelled(self._reason, self._timed_out)
+        if self.expired:
+            raise RequestCancelled("请求超过截止时间", True)
+
+    def add_callback(self, callback):
+        """注册取消时执行的回调，已取消时立即执行
+
+        Args:
+            callback: 无参数的函数
+
+        Returns:
+            Callable: 注销该回调的函数，阻塞操作结束后应调用
+        """
+        with self._lock:
+            if self._reason is None:
+                callback_id = self._next_id
+                self._next_id += 1
+                self._callbacks[callback_id] = callback
+                return lambda: self._callbacks.pop(callback_id, None)
+        callback()
+        return lambda: None
+
+    def release(self):
+        """从父标记上注销，不再随父标记取消"""
+        if self._remove_from_parent is not None:
+            self._remove_from_parent()
+            self._remove_from_parent = None
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败达到 failure_threshold 次后打开，打开期间 allow() 直接返回
+    False，调用方应立即走降级路径而不是等待下游超时。打开后由后台线程
+    每隔 probe_interval 秒调用一次 probe，probe 成功即关闭熔断器。
+    """
+
+    def __init__(self, name, probe, failure_threshold=3, probe_interval=10):
+        """初始化
+
+        Args:
+            name: 名称，用作指标名前缀
+            probe: 探测下游是否恢复的函数，恢复时返回True（抛出异常视为未恢复）
+            failure_threshold: 打开熔断器所需的连续失败次数
+            probe_interval: 打开后的探测间隔秒数
+        """
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open = False
+        self._closed_event = threading.Event()
+
+    @property
+    def is_open(self):
+        """熔断器是否处于打开状态"""
+        return self._open
+
+    def allow(self):
+        """是否允许访问下游
+
+        Returns:
+            bool: 熔断器关闭时返回True
+        """
+        if self._open:
+            metrics.increment(f"{self.name}.short_circuited")
+            return False
+        return True
+
+    def record_success(self):
+        """记录一次成功调用，清零连续失败次数"""
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+
+    def record_failure(self, error=None):
+        """记录一次失败调用，连续失败达到阈值时打开熔断器
+
+        Args:
+            error: 失败原因（可选），用于日志
+        """
+        with self._lock:
+            self._failures += 1
+            if self._open or self._failures < self.failure_threshold:
+                return
+            self._open = True
+            self._closed_event.clear()
+
+        logger.error(
+            f"{self.name} 连续失败 {self.failure_threshold} 次，熔断器打开: {error}"
+        )
+        metrics.increment(f"{self.name}.opened")
+        metrics.set_gauge(f"{self.name}.open", 1)
+        threading.Thread(
+            target=self._probe_loop, name=f"{self.name}-probe", daemon=True
+        ).start()
+
+    def _probe_loop(self):
+        """后台探测，下游恢复后关闭熔断器"""
+        while not self._closed_event.wait(self.probe_interval):
+            try:
+                recovered = self.probe()
+            except Exception as e:
+                logger.info(f"{self.name} 仍不可用: {str(e)}")
+                recovered = False
+            if recovered:
+                self.close()
+
+    def close(self):
+        """关闭熔断器"""
+        with self._lock:
+            self._failures = 0
+            self._open = False
+            self._closed_event.set()
+        logger.info(f"{self.name} 已恢复，熔断器关闭")
+        metrics.set_gauge(f"{self.name}.open", 0)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import atexit
+import contextvars
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from ..config import Config
+
+# 当前请求的ID，由接口层设置，日志记录中以 request_id 字段输出
+request_id = contextvars.ContextVar("request_id", default="-")
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+_handler = None
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """为日志记录添加当前请求的ID（在产生日志的线程中执行）"""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+def _start_listener(handlers):
+    """为 QueueHandler 创建新队列并启动后台写入线程"""
+    global _listener
+    _handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_listener_in_child():
+    """fork 之后子进程中没有父进程的写入线程，重新创建队列和写入线程"""
+    if _listener is not None:
+        _start_listener(_listener.handlers)
+
+
+def stop_logging():
+    """写出队列中剩余的日志并停止写入线程（进程退出前调用）"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def setup_logging(level=None):
+    """配置根日志：请求线程只把记录放入队列，由后台线程格式化并写出
+
+    重复调用无效。多进程生产模式下 fork 出的 worker 会各自启动写入线程。
+
+    Args:
+        level: 日志级别，默认为配置中的LOG_LEVEL
+    """
+    global _handler
+    if _handler is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    _handler = QueueHandler(queue.SimpleQueue())
+    _handler.addFilter(RequestIdFilter())
+    _start_listener([stream_handler])
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level or Config.LOG_LEVEL)
+
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
+    atexit.register(stop_logging)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+class Metrics:
+    """进程内的简单指标registry
+
+    支持计数器、瞬时值和汇总（次数、总和、最大值），通过 /metrics 接口暴露。
+    多 worker 模式下每个进程各自统计。
+    """
+
+    def __init__(self):
+        """初始化指标registry"""
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+
+    def increment(self, name, value=1):
+        """增加计数器
+
+        Args:
+            name: 指标名称
+            value: 增加的数量
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """设置瞬时值
+
+        Args:
+            name: 指标名称
+            value: 当前值
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        """记录一次观测值（例如耗时）
+
+        Args:
+            name: 指标名称
+            value: 观测值
+        """
+        with self._lock:
+            summary = self._summaries.setdefault(
+                name, {"count": 0, "sum": 0.0, "max": 0.0}
+            )
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def snapshot(self):
+        """获取所有指标的快照
+
+        Returns:
+            dict: 包含 counters、gauges 和 summaries 的字典
+        """
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {
+                    name: dict(summary, avg=summary["sum"] / summary["count"])
+                    for name, summary in self._summaries.items()
+                },
+            }
+
+
+metrics = Metrics()
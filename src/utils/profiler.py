@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import time
+from collections import Counter
+
+# 同一时刻只允许一次采样，避免多个采样线程互相放大开销
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """已有采样正在进行"""
+
+
+def _collapse(frame):
+    """把调用栈转换为从外到内、以分号分隔的折叠格式"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = code.co_filename.rsplit("/", 1)[-1]
+        names.append(f"{code.co_name} ({module}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(duration=10.0, interval=0.01):
+    """对当前进程的所有线程做定时栈采样
+
+    每隔 interval 秒读取一次 sys._current_frames()，按线程名和调用栈聚合
+    采样次数。结果为折叠栈格式（每行 "栈 次数"），可直接交给
+    flamegraph.pl 或 speedscope 生成火焰图。采样线程本身不计入结果。
+
+    Args:
+        duration: 采样总秒数
+        interval: 采样间隔秒数
+
+    Returns:
+        str: 折叠栈文本，按次数降序排列
+
+    Raises:
+        ProfilerBusy: 已有采样正在进行
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("已有采样正在进行")
+    try:
+        samples = Counter()
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                thread_name = names.get(thread_id, str(thread_id))
+                samples[f"{thread_name};{_collapse(frame)}"] += 1
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from ..config import Config
+from .logging_config import request_id
+
+_current = contextvars.ContextVar("request_log", default=None)
+
+
+class RequestLog:
+    """一次请求的结构化日志
+
+    请求处理过程中各阶段只记录耗时和字段，请求结束时输出一行JSON，
+    代替每个阶段单独输出的多行日志。SQL、提示等较长的内容按
+    LOG_PAYLOAD_SAMPLE_RATE 抽样记录，同一请求要么全部记录要么都不记录。
+    """
+
+    def __init__(self, event, sample_rate=None):
+        """初始化
+
+        Args:
+            event: 事件名称，作为JSON中的 event 字段
+            sample_rate: 记录完整内容的请求比例，默认为配置中的LOG_PAYLOAD_SAMPLE_RATE
+        """
+        rate = Config.LOG_PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.event = event
+        self.sampled = random.random() < rate
+        self.fields = {}
+        self.stages = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段的耗时（毫秒），同名阶段的耗时累加"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stages[name] = round(self.stages.get(name, 0.0) + elapsed, 2)
+
+    def set(self, **fields):
+        """记录字段，值需可被JSON序列化"""
+        self.fields.update(fields)
+
+    def payload(self, **fields):
+        """记录较长的内容（SQL、提示等），仅在被抽样的请求中记录"""
+        if self.sampled:
+            self.fields.update(fields)
+
+    def emit(self, logger, level=logging.INFO):
+        """输出该请求的JSON日志行"""
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            "event": self.event,
+            "request_id": request_id.get(),
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 2),
+            **self.fields,
+            "stages": self.stages,
+        }
+        logger.log(level, json.dumps(record, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def request_log(event, logger, sample_rate=None):
+    """在上下文中创建当前请求的结构化日志，退出时输出
+
+    Args:
+        event: 事件名称
+        logger: 输出日志的logger
+        sample_rate: 记录完整内容的请求比例（可选）
+
+    Yields:
+        RequestLog: 当前请求的日志
+    """
+    log = RequestLog(event, sample_rate)
+    token = _current.set(log)
+    try:
+        yield log
+    except BaseException as e:
+        log.set(error=type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        log.emit(logger)
+
+
+def current_request_log():
+    """返回当前请求的结构化日志，不在请求中时为None"""
+    return _current.get()
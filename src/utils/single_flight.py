@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import threading
+from .metrics import metrics
+
+# 等待其他调用结果时检查取消标记的间隔秒数
+WAIT_INTERVAL = 0.1
+
+
+class _Call:
+    """一次正在执行的调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """相同键的并发调用合并
+
+    同一时刻相同键的调用只执行一次，其余调用等待该次执行完成并共享其
+    结果（或异常）。执行结束后键即被移除，之后的调用会重新执行。
+    """
+
+    def __init__(self, name="single_flight"):
+        """初始化
+
+        Args:
+            name: 指标名前缀
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, cancel=None, **kwargs):
+        """执行调用，相同键的并发调用只执行一次
+
+        Args:
+            key: 合并键，需可哈希
+            fn: 要执行的函数
+            *args: 函数位置参数
+            cancel: 本次调用的取消标记（可选，不传给 fn），等待其他调用的
+                结果时定期检查，被取消后立即返回而不是等到执行结束
+            **kwargs: 函数关键字参数
+
+        Returns:
+            Tuple[Any, bool]: 函数结果，以及该结果是否来自其他调用的共享执行
+
+        Raises:
+            RequestCancelled: 等待期间本次调用被取消或超过截止时间
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            metrics.increment(f"{self.name}.coalesced")
+            if cancel is None:
+                call.event.wait()
+            else:
+                while not call.event.wait(WAIT_INTERVAL):
+                    cancel.check()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        metrics.increment(f"{self.name}.executed")
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self):
+        """返回正在执行的调用数量"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import re
+import unicodedata
+
+
+def normalize_question(question):
+    """规范化自然语言问题，用于判断两个问题是否相同
+
+    统一全角/半角字符（NFKC）、大小写，去除首尾空白、合并连续空白，
+    并去掉结尾的标点。
+
+    Args:
+        question: 原始问题
+
+    Returns:
+        str: 规范化后的问题
+    """
+    text = unicodedata.normalize("NFKC", question or "").strip().lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip("?？.。!！ ")
+
+
+_TABLE_PATTERN = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE|INTO)\s+((?:[`\"]?\w+[`\"]?\.)?[`\"]?\w+[`\"]?)",
+    re.IGNORECASE,
+)
+
+
+def extract_tables(sql):
+    """提取SQL语句中引用的表名
+
+    只识别 FROM、JOIN、UPDATE、INTO 之后紧跟的表名，足以用于示例的
+    按表过滤；子查询和逗号分隔的多表 FROM 中后续的表不会被识别。
+
+    Args:
+        sql: SQL语句
+
+    Returns:
+        list: 去重后的小写表名（去掉库名前缀和引号），按出现顺序排列
+    """
+    tables = []
+    for match in _TABLE_PATTERN.finditer(sql or ""):
+        table = match.group(1).replace("`", "").replace('"', "").split(".")[-1].lower()
+        if table not in tables:
+            tables.append(table)
+    return tables
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from src.rag.template_sql import SQLTemplate, synthesize_sql
+
+
+def test_fill_replaces_value_from_question():
+    template = SQLTemplate(
+        "查询歌手Adele的专辑", "SELECT album_title FROM raw_albums WHERE artist = 'Adele'"
+    )
+    assert (
+        template.fill("查询歌手Taylor的专辑")
+        == "SELECT album_title FROM raw_albums WHERE artist = 'Taylor'"
+    )
+
+
+def test_numeric_value_replaced():
+    template = SQLTemplate(
+        "查询2023年的专辑", "SELECT album_title FROM raw_albums WHERE year = 2023"
+    )
+    assert (
+        template.fill("查询2024年的专辑")
+        == "SELECT album_title FROM raw_albums WHERE year = 2024"
+    )
+
+
+def test_limit_not_parameterized():
+    template = SQLTemplate(
+        "查询id为1的专辑", "SELECT album_title FROM raw_albums WHERE album_id = 1 LIMIT 1"
+    )
+    assert template.fill("查询id为7的专辑") is None
+
+
+def test_limit_kept_when_value_differs():
+    template = SQLTemplate(
+        "查询id为3的专辑", "SELECT album_title FROM raw_albums WHERE album_id = 3 LIMIT 10"
+    )
+    assert (
+        template.fill("查询id为7的专辑")
+        == "SELECT album_title FROM raw_albums WHERE album_id = 7 LIMIT 10"
+    )
+
+
+def test_offset_not_parameterized():
+    template = SQLTemplate(
+        "查询前5个专辑", "SELECT album_title FROM raw_albums LIMIT 5 OFFSET 5"
+    )
+    assert template.slots == []
+    template = SQLTemplate("查询前5个专辑", "SELECT album_title FROM raw_albums LIMIT 5")
+    assert template.fill("查询前8个专辑") is None
+
+
+def test_numeric_literal_not_in_question_kept():
+    template = SQLTemplate(
+        "查询歌手Adele的专辑",
+        "SELECT album_title FROM raw_albums WHERE artist = 'Adele' AND album_listens > 100",
+    )
+    assert template.fill("查询歌手Bob的专辑").endswith(
+        "artist = 'Bob' AND album_listens > 100"
+    )
+
+
+def test_value_repeated_in_sql_refused():
+    template = SQLTemplate(
+        "查询歌手Adele的专辑",
+        "SELECT album_title FROM raw_albums WHERE artist = 'Adele' OR composer = 'Adele'",
+    )
+    assert template.slots == []
+    assert template.fill("查询歌手Bob的专辑") is None
+
+
+def test_slots_sharing_value_refused():
+    template = SQLTemplate(
+        "查询编号7的专辑",
+        "SELECT album_title FROM raw_albums WHERE album_id = 7 OR album_code = '7'",
+    )
+    assert template.fill("查询编号8的专辑") is None
+
+
+def test_compound_value_rejected():
+    template = SQLTemplate(
+        "查询歌手Adele的专辑", "SELECT album_title FROM raw_albums WHERE artist = 'Adele'"
+    )
+    assert template.fill("查询歌手Adele和Bob的专辑") is None
+    assert template.fill("查询歌手Adele、Bob的专辑") is None
+    assert template.fill("查询歌手Adele, Bob的专辑") is None
+    assert template.fill("查询歌手Adele and Bob的专辑") is None
+    assert template.fill("查询歌手Taylor Swift的专辑") is None
+
+
+def test_synthesize_skips_unusable_examples():
+    examples = [
+        {"question": "查询id为1的专辑", "sql": "SELECT * FROM raw_albums WHERE album_id = 1 LIMIT 1"},
+        {"question": "查询id为2的专辑", "sql": "SELECT * FROM raw_albums WHERE album_id = 2"},
+    ]
+    sql, example = synthesize_sql("查询id为7的专辑", examples)
+    assert sql == "SELECT * FROM raw_albums WHERE album_id = 7"
+    assert example is examples[1]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""InMemoryVectorStore 并发测试
+
+多个线程同时执行（带过滤和词法检索的）搜索、插入、批量导入、压缩和保存，
+容量上限和去重都处于启用状态，使淘汰、压缩和 _replace 与读写并发执行。
+"""
+import threading
+import time
+
+import numpy as np
+
+from src.rag.vectordb.vector_store import InMemoryVectorStore
+from src.utils.text import normalize_question
+
+DIM = 64
+MAX_SIZE = 400
+TABLES = ["albums", "artists", "tracks", "genres"]
+
+
+def _metadata(question, vector, n):
+    table = TABLES[n % len(TABLES)]
+    # x 记录向量首个分量，用于检查向量与元数据是否错位
+    return {
+        "question": question,
+        "sql": f"SELECT * FROM {table}",
+        "tables": [table],
+        "x": float(vector[0]),
+    }
+
+
+def _check_aligned(store, errors, label):
+    snapshot = store._snapshot
+    if snapshot.matrix is None:
+        return
+    vectors = snapshot.matrix[: snapshot.size]
+    metadata = snapshot.metadata[: snapshot.size]
+    if len(vectors) and not np.allclose(vectors[:, 0], [m["x"] for m in metadata]):
+        errors.append(f"{label}: 向量与元数据错位")
+
+
+def test_concurrent_search_insert_compact_save(tmp_path):
+    save_path = str(tmp_path / "vector_store.pkl")
+    store = InMemoryVectorStore(save_path=save_path, max_size=MAX_SIZE, dedup_threshold=0.97)
+    store.lexical_weight = 0.3
+
+    rng = np.random.default_rng(0)
+    for i in range(300):
+        vector = rng.standard_normal(DIM).astype(np.float32)
+        store.upsert(vector, _metadata(f"初始问题 {i} 专辑", vector, i))
+
+    stop = threading.Event()
+    errors = []
+    counts = {"search": 0, "insert": 0, "bulk": 0, "compact": 0, "save": 0}
+    counts_lock = threading.Lock()
+    merged = []
+
+    def record(kind):
+        with counts_lock:
+            counts[kind] += 1
+
+    def run(kind, step):
+        def loop():
+            n = 0
+            while not stop.is_set():
+                try:
+                    step(n)
+                    record(kind)
+                except Exception as e:
+                    errors.append(f"{kind} 异常: {e!r}")
+                n += 1
+
+        return threading.Thread(target=loop, name=kind)
+
+    def search(n):
+        local_rng = np.random.default_rng(n)
+        query = local_rng.standard_normal(DIM).astype(np.float32)
+        table = TABLES[n % len(TABLES)]
+        filters = {"tables": table} if n % 2 else None
+        results = store.search(query, top_k=10, filters=filters, query_text=f"问题 {n} 专辑")
+        scores = [float(score) for score, _ in results]
+        if scores != sorted(scores, reverse=True):
+            errors.append("搜索结果未按得分排序")
+        if filters and any(table not in m["tables"] for _, m in results):
+            errors.append("搜索结果不满足过滤条件")
+
+    def insert(n):
+        vector = rng.standard_normal(DIM).astype(np.float32)
+        store.upsert(vector, _metadata(f"问题 {threading.get_ident()}-{n}", vector, n))
+
+    def bulk(n):
+        # 批量导入只按问题去重，近似的向量留给压缩合并
+        base = rng.standard_normal(DIM).astype(np.float32)
+        vectors = [base + 0.001 * rng.standard_normal(DIM).astype(np.float32) for _ in range(4)]
+        store.upsert_many(
+            vectors, [_metadata(f"批量 {n}-{i}", v, n) for i, v in enumerate(vectors)]
+        )
+
+    def compact(n):
+        merged.append(store.compact())
+        _check_aligned(store, errors, "压缩后")
+        time.sleep(0.05)
+
+    def save(n):
+        store.save()
+        loaded = InMemoryVectorStore(save_path=save_path, max_size=0)
+        if not loaded.load():
+            errors.append("保存的文件无法加载")
+        else:
+            _check_aligned(loaded, errors, "保存的文件")
+        time.sleep(0.05)
+
+    threads = [run("search", search) for _ in range(4)]
+    threads += [run("insert", insert) for _ in range(2)]
+    threads += [run("bulk", bulk), run("compact", compact), run("save", save)]
+    for thread in threads:
+        thread.start()
+    time.sleep(2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors[:10]
+    assert all(counts.values()), counts
+    assert any(merged), "压缩没有合并任何示例"
+    assert len(store) <= MAX_SIZE
+    _check_aligned(store, errors, "结束时")
+    assert not errors, errors
+    # 问题索引与行号一致
+    for question, row in store._question_index.items():
+        assert normalize_question(store.metadata[row]["question"]) == question